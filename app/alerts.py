@@ -0,0 +1,185 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# Live threshold alerts, evaluated inline on every reading in the MQTT ingest path.
+#
+# Rules come from ALERT_<metric> settings (see config.config). Evaluation is a dict lookup
+# by topic plus a few comparisons per rule, with constant state per rule. Emails are sent
+# from a background thread so a slow SMTP server never holds up the MQTT loop.
+
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from config.config import get_config
+
+FIRED = "fired"
+CLEARED = "cleared"
+
+class AlertRule:
+    """
+    A threshold on one topic with hysteresis and a minimum duration.
+    The rule fires once the value has been past the threshold for `seconds`, and re-arms
+    only after the value has recovered past `clear`.
+    """
+    __slots__ = ("topic", "below", "threshold", "clear", "seconds", "pending_since", "active", "last_sent")
+
+    def __init__(self, topic, below, threshold, clear, seconds):
+        self.topic = topic
+        self.below = below
+        self.threshold = threshold
+        self.clear = clear
+        self.seconds = seconds
+        self.pending_since = None
+        self.active = False
+        self.last_sent = None
+
+    def update(self, timestamp, value):
+        """Feed one reading; returns FIRED or CLEARED when the rule changes state, else None."""
+        if self.active:
+            if (value >= self.clear) if self.below else (value <= self.clear):
+                self.active = False
+                self.pending_since = None
+                return CLEARED
+            return None
+
+        if not ((value < self.threshold) if self.below else (value > self.threshold)):
+            self.pending_since = None
+            return None
+        if self.pending_since is None:
+            self.pending_since = timestamp
+        if timestamp - self.pending_since >= self.seconds:
+            self.active = True
+            return FIRED
+        return None
+
+    def describe(self):
+        metric = self.topic.split("/")[-2].replace("_", " ")
+        condition = f"{'below' if self.below else 'above'} {self.threshold:g}"
+        if self.seconds:
+            condition += f" for {self.seconds}s"
+        return f"{metric} {condition}"
+
+class AlertEngine:
+    """
+    Evaluates rules against incoming readings and hands fired alerts to `notify`
+    (and recoveries to `on_clear`, if given).
+    Alerts are rate limited per rule (cooldown) and overall (max_per_hour).
+    """
+
+    def __init__(self, rules, cooldown, max_per_hour, notify, on_clear=None):
+        self.rules_by_topic = {}
+        for rule in rules:
+            self.rules_by_topic.setdefault(rule.topic, []).append(rule)
+        self.cooldown = cooldown
+        self.max_per_hour = max_per_hour
+        self.notify = notify
+        self.on_clear = on_clear
+        self.sent_times = deque()
+        self.suppressed = 0
+
+    def evaluate(self, topic, timestamp, value):
+        rules = self.rules_by_topic.get(topic)
+        if rules is None:
+            return
+        for rule in rules:
+            change = rule.update(timestamp, value)
+            if change is FIRED:
+                self._fire(rule, timestamp, value)
+            elif change is CLEARED and self.on_clear is not None:
+                self.on_clear(rule, timestamp, value)
+
+    def _fire(self, rule, timestamp, value):
+        # The same condition re-triggering (e.g. flapping around the clear level) is a duplicate
+        if rule.last_sent is not None and timestamp - rule.last_sent < self.cooldown:
+            return
+
+        while self.sent_times and timestamp - self.sent_times[0] >= 3600:
+            self.sent_times.popleft()
+        if len(self.sent_times) >= self.max_per_hour:
+            self.suppressed += 1
+            print(f"⚠️ Alert rate limit reached, not sending: {rule.describe()} (value {value})")
+            return
+
+        rule.last_sent = timestamp
+        self.sent_times.append(timestamp)
+        suppressed, self.suppressed = self.suppressed, 0
+        self.notify(rule, timestamp, value, suppressed)
+
+_outbox = queue.Queue()
+_sender = None
+_sender_lock = threading.Lock()
+
+def _send_pending():
+    from app.emailer import send_email
+
+    while True:
+        alerts = [_outbox.get()]
+        # Give alerts fired by the same event a moment to arrive, then send them as one email
+        time.sleep(1)
+        while not _outbox.empty():
+            alerts.append(_outbox.get_nowait())
+
+        config = get_config()
+        unique = {}
+        for rule, timestamp, value, suppressed in alerts:
+            unique[(rule.topic, rule.below, rule.threshold)] = (rule, timestamp, value, suppressed)
+
+        items = ""
+        for rule, timestamp, value, suppressed in unique.values():
+            when = datetime.fromtimestamp(timestamp, config.TZINFO).strftime('%Y-%m-%d %H:%M:%S')
+            items += f"<li><strong>{rule.describe()}</strong>: {round(value, 2)} at {when}</li>"
+            if suppressed:
+                items += f"<li>{suppressed} earlier alert(s) were not sent because of the rate limit.</li>"
+
+        subject = "⚠️ Solar Alert - " + ", ".join(rule.describe() for rule, _, _, _ in unique.values())
+        body = f"""
+<html>
+  <body>
+    <h2>⚠️ Solar Assistant Alert</h2>
+    <ul>{items}</ul>
+    <p style="font-size:12px;color:gray;">Generated automatically by Email Scheduler for Solar Assistant 🌞</p>
+  </body>
+</html>
+"""
+        send_email(subject=subject, body=body, config=config)
+
+def queue_alert_email(rule, timestamp, value, suppressed):
+    global _sender
+    print(f"🚨 Alert: {rule.describe()} (value {value})")
+    _outbox.put((rule, timestamp, value, suppressed))
+    if _sender is None:
+        with _sender_lock:
+            if _sender is None:
+                _sender = threading.Thread(target=_send_pending, name="alert-email", daemon=True)
+                _sender.start()
+
+def log_cleared(rule, timestamp, value):
+    print(f"✅ Alert cleared: {rule.describe()} (now {value})")
+
+def build_engine(config=None, notify=queue_alert_email):
+    config = config or get_config()
+    rules = [AlertRule(*spec) for spec in config.ALERT_RULES]
+    return AlertEngine(rules, config.ALERT_COOLDOWN, config.ALERT_MAX_PER_HOUR, notify, on_clear=log_cleared)
+
+engine = build_engine()
+
+def reload_rules(config):
+    """Replace the alert rules after a config reload; rule state starts fresh."""
+    global engine
+    engine = build_engine(config)
+    print(f"🚨 {len(config.ALERT_RULES)} alert rules loaded.")
+
+def evaluate(topic, timestamp, value):
+    engine.evaluate(topic, timestamp, value)
@@ -0,0 +1,94 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# Batch regeneration of reports for many consecutive periods, e.g. a year of monthly reports:
+#
+#     python -m app.report --period monthly --count 12 --output reports/
+#
+# Queries run on a thread pool (SQLite releases the GIL while it works), rendering and MIME
+# encoding run on a process pool, and finished messages are sent (or written as .eml files)
+# from the main thread. Only fetch_report_data() output crosses the process boundary, with
+# the readings packed into arrays.
+
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from config.config import get_config
+from app.report_generator import PERIOD_DAYS, fetch_report_data, render_report_message
+from app.utils import local_now
+
+# SQLite readers per batch; more mostly contend for the same disk
+QUERY_THREADS = 2
+
+def report_end_dates(period, count, now):
+    """End dates of `count` consecutive, non-overlapping periods, the latest ending now."""
+    days = PERIOD_DAYS.get(period, 1)
+    return [now - timedelta(days=days * i) for i in range(count)]
+
+def generate_reports_batch(period, count, workers=None, output_dir=None):
+    """
+    Generate `count` reports of the given period and send them, or write them to output_dir.
+    Returns the number of reports produced.
+    """
+    config = get_config()
+    workers = workers or os.cpu_count() or 1
+    end_dates = report_end_dates(period, count, local_now(config))
+    print(f"📚 Generating {len(end_dates)} {period} reports with {workers} render processes...")
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    produced = 0
+    # Spawned (not forked) workers, since the query threads may be running when the pool starts
+    with ThreadPoolExecutor(max_workers=QUERY_THREADS) as query_pool, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as render_pool:
+        queries = {query_pool.submit(fetch_report_data, period, end_date, config): end_date for end_date in end_dates}
+
+        renders = {}
+        for query in as_completed(queries):
+            label = f"{period} report ending {queries[query].strftime('%Y-%m-%d')}"
+            try:
+                data = query.result()
+            except Exception as e:
+                print(f"❌ Error fetching {label}: {e}")
+                continue
+            if data is not None:
+                renders[render_pool.submit(render_report_message, data, config)] = label
+
+        from app.emailer import send_message, to_header
+        for render in as_completed(renders):
+            try:
+                subject, message = render.result()
+            except Exception as e:
+                print(f"❌ Error rendering {renders[render]}: {e}")
+                continue
+            if output_dir:
+                filename = re.sub(r"[^\w.-]+", "_", subject).strip("_") + ".eml"
+                with open(os.path.join(output_dir, filename), "wb") as f:
+                    f.write(to_header(config.EMAIL_RECIPIENTS))
+                    f.write(message)
+                print(f"💾 Wrote {filename}")
+            else:
+                try:
+                    send_message(message, config)
+                except Exception as e:
+                    print(f"❌ Error sending {subject}: {e}")
+                    continue
+                print(f"✅ Sent {subject}")
+            produced += 1
+
+    print(f"📚 {produced} reports done in {time.perf_counter() - started:.1f}s")
+    return produced
@@ -0,0 +1,228 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# Inline charts for the report emails.
+#
+# Each chart topic is first reduced to one (min, max) pair per pixel column, in SQL for
+# stored readings or from the live store for today, so rendering only ever touches
+# CHART_WIDTH buckets however many readings the period holds. Buckets of closed days are
+# cached on disk, and so are the day charts of closed days; anything that back-fills
+# readings evicts the affected days. Images are PNG (stdlib zlib only) because most email
+# clients do not display SVG.
+
+import math
+import os
+import struct
+import zlib
+from array import array
+from config.config import TOPIC_TEMPLATE
+
+CHART_WIDTH = 600
+CHART_HEIGHT = 120
+SPARKLINE_WIDTH = 120
+SPARKLINE_HEIGHT = 24
+
+# Charted metrics: (metric, title, RGB colour)
+CHART_METRICS = [
+    ('pv_power', 'PV Power (W)', (242, 169, 0)),
+    ('load_power', 'Load Power (W)', (52, 120, 198)),
+    ('battery_state_of_charge', 'Battery SOC (%)', (46, 160, 67)),
+    ('grid_power', 'Grid Power (W)', (200, 60, 60)),
+]
+
+# Longest local day (DST fall-back), for matching cached days to a time range
+MAX_DAY_SECONDS = 25 * 3600
+
+# Palette indices used by the renderer
+BACKGROUND, GRIDLINE, SERIES = 0, 1, 2
+
+def cache_dir(config):
+    return os.path.join(os.path.dirname(os.path.abspath(config.DATABASE_PATH)), 'chart_cache')
+
+def clear_cache(config, start=None, end=None):
+    """
+    Drop cached buckets and images of the days overlapping [start, end), or all of them,
+    e.g. after readings of closed days were imported, replayed or migrated.
+    """
+    directory = cache_dir(config)
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if start is not None:
+            # Names are <metric>-<day start epoch>-<suffix>; a local day lasts at most 25 hours
+            day_start = int(name.split('-')[1])
+            if day_start >= end or day_start + MAX_DAY_SECONDS <= start:
+                continue
+        os.remove(os.path.join(directory, name))
+
+def _cache_path(config, metric, day_start, suffix):
+    return os.path.join(cache_dir(config), f"{metric}-{day_start}-{suffix}")
+
+def _write_cache(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+def query_buckets(cursor, topic, start, end, buckets):
+    """Min/max per bucket between two epochs, aggregated by SQLite. Empty buckets are NaN."""
+    mins = array('d', [math.nan]) * buckets
+    maxs = array('d', [math.nan]) * buckets
+    cursor.execute('''
+        SELECT (timestamp - ?) * ? / ? AS bucket, MIN(value), MAX(value) FROM readings
+        WHERE topic = ? AND timestamp >= ? AND timestamp < ?
+        GROUP BY bucket
+    ''', (start, buckets, end - start, topic, start, end))
+    for bucket, low, high in cursor.fetchall():
+        mins[bucket] = low
+        maxs[bucket] = high
+    return mins, maxs
+
+def downsample(timestamps, values, start, end, buckets):
+    """Min/max per bucket for readings already in memory (the live store)."""
+    mins = array('d', [math.nan]) * buckets
+    maxs = array('d', [math.nan]) * buckets
+    span = end - start
+    for timestamp, value in zip(timestamps, values):
+        bucket = int((timestamp - start) * buckets // span)
+        if 0 <= bucket < buckets:
+            if not mins[bucket] <= value:  # also true for NaN
+                mins[bucket] = value
+            if not maxs[bucket] >= value:
+                maxs[bucket] = value
+    return mins, maxs
+
+def fetch_chart_buckets(cursor, day_bounds, config, now_epoch, live=None):
+    """
+    The fetch stage for charts: {metric: (mins, maxs)} with CHART_WIDTH // days buckets per day.
+    Closed days come from the cache when possible; today comes from the live store if given
+    and it holds all of today's readings (a one-shot process never warms it).
+    """
+    days = len(day_bounds) - 1
+    per_day = max(CHART_WIDTH // days, 1)
+    charts = {}
+    for metric, _, _ in CHART_METRICS:
+        topic = TOPIC_TEMPLATE.format(metric)
+        mins = array('d')
+        maxs = array('d')
+        for i in range(days):
+            day_start, day_end = day_bounds[i], day_bounds[i + 1]
+            closed = day_end <= now_epoch
+            path = _cache_path(config, metric, day_start, f"{per_day}.bin")
+            if closed and os.path.exists(path):
+                cached = array('d')
+                with open(path, 'rb') as f:
+                    cached.frombytes(f.read())
+                day_mins, day_maxs = cached[:per_day], cached[per_day:]
+            elif live is not None and not closed and live.covers(day_start):
+                day_mins, day_maxs = downsample(*live.series(topic, day_start, day_end), day_start, day_end, per_day)
+            else:
+                day_mins, day_maxs = query_buckets(cursor, topic, day_start, day_end, per_day)
+                if closed:
+                    _write_cache(path, (day_mins + day_maxs).tobytes())
+            mins.extend(day_mins)
+            maxs.extend(day_maxs)
+        if any(not math.isnan(value) for value in maxs):
+            charts[metric] = (mins, maxs)
+    return charts
+
+def encode_png(width, height, pixels, palette):
+    """Encode rows of palette indices (one bytearray per row) as an 8-bit indexed PNG."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    raw = b''.join(b'\x00' + bytes(row) for row in pixels)
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0))
+            + chunk(b'PLTE', b''.join(bytes(colour) for colour in palette))
+            + chunk(b'IDAT', zlib.compress(raw, 9))
+            + chunk(b'IEND', b''))
+
+def _resample(mins, maxs, width):
+    """Merge or stretch buckets to exactly `width` columns."""
+    count = len(mins)
+    if count == width:
+        return mins, maxs
+    out_mins = array('d', [math.nan]) * width
+    out_maxs = array('d', [math.nan]) * width
+    for x in range(width):
+        lo = x * count // width
+        hi = max((x + 1) * count // width, lo + 1)
+        low = [v for v in mins[lo:hi] if not math.isnan(v)]
+        high = [v for v in maxs[lo:hi] if not math.isnan(v)]
+        if low:
+            out_mins[x] = min(low)
+            out_maxs[x] = max(high)
+    return out_mins, out_maxs
+
+def render_chart(mins, maxs, colour, width=CHART_WIDTH, height=CHART_HEIGHT, gridlines=True):
+    """Render min/max buckets as a filled band, one column per bucket. Returns PNG bytes."""
+    mins, maxs = _resample(mins, maxs, width)
+    present = [v for v in mins if not math.isnan(v)] + [v for v in maxs if not math.isnan(v)]
+    low, high = min(present), max(present)
+    if low > 0 and gridlines:
+        low = 0.0  # Anchor full charts of positive quantities at zero; sparklines show the shape
+    if high == low:
+        high = low + 1.0
+    scale = (height - 1) / (high - low)
+
+    def y_of(value):
+        return height - 1 - int(round((value - low) * scale))
+
+    pixels = [bytearray(width) for _ in range(height)]
+    if gridlines:
+        for y in {0, height - 1, y_of(0.0) if low <= 0.0 <= high else 0}:
+            pixels[y][:] = bytes([GRIDLINE]) * width
+
+    previous = None
+    for x in range(width):
+        if math.isnan(mins[x]):
+            previous = None
+            continue
+        top, bottom = y_of(maxs[x]), y_of(mins[x])
+        # Join to the previous column so steep changes stay connected
+        if previous is not None:
+            top = min(top, previous[1])
+            bottom = max(bottom, previous[0])
+        for y in range(top, bottom + 1):
+            pixels[y][x] = SERIES
+        previous = (y_of(maxs[x]), y_of(mins[x]))
+
+    palette = [(255, 255, 255), (225, 225, 225), colour]
+    return encode_png(width, height, pixels, palette)
+
+def render_charts(charts, config, single_closed_day=None):
+    """
+    The render stage for charts: [(cid, title, chart_png, sparkline_png)] for each charted metric.
+    single_closed_day is the day start epoch when the report covers one finished day, whose
+    rendered charts are cached.
+    """
+    rendered = []
+    for metric, title, colour in CHART_METRICS:
+        if metric not in charts:
+            continue
+        mins, maxs = charts[metric]
+        images = []
+        for kind, width, height in (('chart', CHART_WIDTH, CHART_HEIGHT), ('spark', SPARKLINE_WIDTH, SPARKLINE_HEIGHT)):
+            path = _cache_path(config, metric, single_closed_day, f"{kind}{width}x{height}.png")
+            if single_closed_day is not None and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    images.append(f.read())
+                continue
+            png = render_chart(mins, maxs, colour, width, height, gridlines=kind == 'chart')
+            if single_closed_day is not None:
+                _write_cache(path, png)
+            images.append(png)
+        rendered.append((f"chart_{metric}", title, images[0], images[1]))
+    return rendered
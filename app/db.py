@@ -11,38 +11,292 @@ https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
 Thank you for your support!
 """
 
+import re
 import sqlite3
-from datetime import datetime
-from config.config import Config
+import time
+from datetime import datetime, timezone
+from config.config import get_config
+from app.utils import local_tz, parse_timestamp
 import os
 
-DB_FILE = Config.DATABASE_PATH
+# Rows converted per batch when migrating naive text timestamps
+MIGRATION_BATCH_SIZE = 10000
 
-def init_db():
-    if not os.path.exists(os.path.dirname(DB_FILE)):
-        os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+# Indexes on readings, by name. Bulk loads drop and rebuild them around the insert.
+INDEXES = {
+    'idx_readings_topic_timestamp': 'CREATE INDEX IF NOT EXISTS {schema}.idx_readings_topic_timestamp ON readings (topic, timestamp)',
+    'idx_readings_timestamp': 'CREATE INDEX IF NOT EXISTS {schema}.idx_readings_timestamp ON readings (timestamp)',
+}
 
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+# With STORAGE_MODE=monthly, readings live in one SQLite file per UTC month next to the main
+# database (data/solar_assistant-2025-06.db, ...). Writers open the file of their reading's
+# month; readers use open_range(), which attaches only the months overlapping their range
+# behind a temporary `readings` view, so queries are written the same way in both modes.
+# Retention is deleting whole month files.
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS readings (
+def connect(config=None):
+    return sqlite3.connect((config or get_config()).DATABASE_PATH)
+
+def create_readings_table(conn, schema='main'):
+    # Timestamps are stored as UTC epoch seconds; day bucketing to the local TZ happens at report time.
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.readings (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
             topic TEXT NOT NULL,
             value REAL NOT NULL
         )
     ''')
 
+def partition_key(timestamp):
+    """The partition (UTC month, e.g. '2025-06') a timestamp belongs to."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m')
+
+def month_bounds(key):
+    """Start and end (exclusive) epochs of a partition."""
+    year, month = map(int, key.split('-'))
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+def partition_keys(start, end):
+    """The partitions overlapping the epoch range [start, end)."""
+    keys = []
+    key = partition_key(start)
+    while True:
+        keys.append(key)
+        key_end = month_bounds(key)[1]
+        if key_end >= end:
+            return keys
+        key = partition_key(key_end)
+
+def partition_path(key, config=None):
+    base, extension = os.path.splitext((config or get_config()).DATABASE_PATH)
+    return f"{base}-{key}{extension or '.db'}"
+
+def list_partitions(config=None):
+    """Keys of the partition files that exist, oldest first."""
+    config = config or get_config()
+    directory = os.path.dirname(os.path.abspath(config.DATABASE_PATH))
+    base, extension = os.path.splitext(os.path.basename(config.DATABASE_PATH))
+    pattern = re.compile(re.escape(base) + r'-(\d{4}-\d{2})' + re.escape(extension or '.db'))
+    matches = (pattern.fullmatch(name) for name in os.listdir(directory))
+    return sorted(match.group(1) for match in matches if match)
+
+def attach_partition(conn, key, config=None, create=False):
+    """Attach a month file as schema p_YYYY_MM and return the schema name."""
+    schema = 'p_' + key.replace('-', '_')
+    conn.execute(f'ATTACH DATABASE ? AS {schema}', (partition_path(key, config),))
+    if create:
+        create_readings_table(conn, schema)
+        create_indexes(conn, schema)
+    return schema
+
+def open_range(start, end, config=None):
+    """
+    A connection on which `readings` holds (at least) all readings in [start, end).
+    In single-file mode that is simply the main database.
+    """
+    config = config or get_config()
+    conn = connect(config)
+    if config.STORAGE_MODE != 'monthly':
+        return conn
+
+    keys = [key for key in partition_keys(start, end) if os.path.exists(partition_path(key, config))]
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(keys) > limit:
+        conn.close()
+        raise ValueError(f"Range spans {len(keys)} monthly partitions, more than SQLite can attach at once ({limit})")
+    if keys:
+        schemas = [attach_partition(conn, key, config) for key in keys]
+        conn.execute('CREATE TEMP VIEW readings AS ' + ' UNION ALL '.join(
+            f'SELECT timestamp, topic, value FROM {schema}.readings' for schema in schemas))
+    return conn
+
+_ready_partitions = set()
+
+def connect_for_write(timestamp, config=None):
+    """A connection whose main `readings` table is where a reading at `timestamp` is stored."""
+    config = config or get_config()
+    if config.STORAGE_MODE != 'monthly':
+        return connect(config)
+
+    path = partition_path(partition_key(timestamp), config)
+    conn = sqlite3.connect(path)
+    if path not in _ready_partitions:
+        create_readings_table(conn)
+        create_indexes(conn)
+        conn.commit()
+        _ready_partitions.add(path)
+    return conn
+
+def insert_readings(rows, config=None, batch=None):
+    """
+    Insert (timestamp, topic, value) rows, one transaction per partition. A batch name is
+    recorded in the same transaction, so inserting the same batch again is harmless; readings
+    that merely repeat a stored value are still inserted.
+    Returns the number of rows inserted.
+    """
+    config = config or get_config()
+    groups = {}
+    for row in rows:
+        key = partition_key(row[0]) if config.STORAGE_MODE == 'monthly' else None
+        groups.setdefault(key, []).append(row)
+
+    inserted = 0
+    for group in groups.values():
+        conn = connect_for_write(group[0][0], config)
+        try:
+            conn.execute('BEGIN')
+            if batch is not None:
+                conn.execute('CREATE TABLE IF NOT EXISTS inserted_batches (batch TEXT PRIMARY KEY)')
+                if not conn.execute('INSERT OR IGNORE INTO inserted_batches (batch) VALUES (?)', (batch,)).rowcount:
+                    conn.rollback()
+                    continue
+            inserted += conn.executemany('INSERT INTO readings (timestamp, topic, value) VALUES (?, ?, ?)', group).rowcount
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # Cached charts of the days these rows belong to are stale now
+    if inserted:
+        from app.charts import clear_cache
+        clear_cache(config, min(row[0] for row in rows), max(row[0] for row in rows) + 1)
+    return inserted
+
+def split_into_partitions(conn, config=None):
+    """Move readings from the main database into monthly partitions, one month per transaction."""
+    row = conn.execute('SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM main.readings').fetchone()
+    if not row[2]:
+        return
+    print(f"🔄 Moving {row[2]} readings into monthly partition files...")
+    for key in partition_keys(row[0], row[1] + 1):
+        start, end = month_bounds(key)
+        if conn.execute('SELECT 1 FROM main.readings WHERE timestamp >= ? AND timestamp < ? LIMIT 1',
+                        (start, end)).fetchone() is None:
+            continue
+        schema = attach_partition(conn, key, config, create=True)
+        conn.execute('BEGIN')
+        conn.execute(f'''
+            INSERT INTO {schema}.readings (timestamp, topic, value)
+            SELECT timestamp, topic, value FROM main.readings
+            WHERE timestamp >= ? AND timestamp < ?
+        ''', (start, end))
+        conn.execute('DELETE FROM main.readings WHERE timestamp >= ? AND timestamp < ?', (start, end))
+        conn.commit()
+        conn.execute(f'DETACH DATABASE {schema}')
+    conn.execute('VACUUM')
+    from app.charts import clear_cache
+    clear_cache(config or get_config())
+    print("✅ Readings moved into monthly partition files.")
+
+def prune_partitions(config=None):
+    """Delete the partition files of months older than RETENTION_MONTHS (0 keeps everything)."""
+    config = config or get_config()
+    if config.STORAGE_MODE != 'monthly' or not config.RETENTION_MONTHS:
+        return []
+    # The current month plus RETENTION_MONTHS - 1 before it are kept
+    oldest_kept = partition_key(time.time())
+    for _ in range(config.RETENTION_MONTHS - 1):
+        oldest_kept = partition_key(month_bounds(oldest_kept)[0] - 1)
+    removed = [key for key in list_partitions(config) if key < oldest_kept]
+    for key in removed:
+        path = partition_path(key, config)
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        _ready_partitions.discard(path)
+        print(f"🗑️ Removed readings of {key} ({os.path.basename(path)})")
+    return removed
+
+def init_db():
+    db_dir = os.path.dirname(get_config().DATABASE_PATH)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir, exist_ok=True)
+
+    conn = connect()
+    create_readings_table(conn)
+
+    migrate_naive_timestamps(conn)
+
+    create_indexes(conn)
+
     conn.commit()
+
+    # Switching to monthly storage moves the existing readings into their month files
+    if get_config().STORAGE_MODE == 'monthly':
+        split_into_partitions(conn)
+
     conn.close()
     print("📦 Database initialized!")
 
-def save_reading(topic, value):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+def create_indexes(conn, schema='main'):
+    for statement in INDEXES.values():
+        conn.execute(statement.format(schema=schema))
+
+def drop_indexes(conn, schema='main'):
+    for name in INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {schema}.{name}')
+
+def migrate_naive_timestamps(conn):
+    """
+    Convert a readings table created with naive local-time TEXT timestamps to UTC epoch integers.
+    The old rows are interpreted in the configured TZ. The table is rebuilt because a TEXT
+    column would keep coercing the new integer values back to text.
+    """
+    columns = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(readings)')}
+    if columns.get('timestamp', '').upper() != 'TEXT':
+        return
+
+    print("🔄 Migrating readings to UTC epoch timestamps...")
+    tz = local_tz()
+    # One transaction, so an interrupted migration leaves the original table untouched
+    conn.execute('BEGIN')
+    conn.execute('ALTER TABLE readings RENAME TO readings_naive')
+    conn.execute('''
+        CREATE TABLE readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp INTEGER NOT NULL,
+            topic TEXT NOT NULL,
+            value REAL NOT NULL
+        )
+    ''')
 
-    timestamp = datetime.now().isoformat()
+    source = conn.cursor()
+    source.execute('SELECT id, timestamp, topic, value FROM readings_naive ORDER BY id')
+    migrated = 0
+    skipped = 0
+    while True:
+        batch = source.fetchmany(MIGRATION_BATCH_SIZE)
+        if not batch:
+            break
+        converted = []
+        for row_id, timestamp, topic, value in batch:
+            try:
+                converted.append((row_id, parse_timestamp(timestamp, tz), topic, value))
+            except (TypeError, ValueError):
+                skipped += 1
+        conn.executemany('''
+            INSERT INTO readings (id, timestamp, topic, value)
+            VALUES (?, ?, ?, ?)
+        ''', converted)
+        migrated += len(converted)
+
+    conn.execute('DROP TABLE readings_naive')
+    conn.commit()
+    from app.charts import clear_cache
+    clear_cache(get_config())
+    print(f"✅ Migrated {migrated} readings ({skipped} unparseable rows skipped).")
+
+def save_reading(topic, value, timestamp=None):
+    if timestamp is None:
+        timestamp = int(time.time())
+
+    conn = connect_for_write(timestamp)
+    cursor = conn.cursor()
 
     cursor.execute('''
         INSERT INTO readings (timestamp, topic, value)
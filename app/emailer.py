@@ -10,49 +10,202 @@ https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
 
 Thank you for your support!
 """
+
+# Messages are generated once, as bytes, into a spooled temporary file and streamed to the
+# SMTP server line by line. Recipient groups (EMAIL_TO entries separated by ';') share that
+# one copy: each group gets its own envelope with only its own addresses in the To header.
+
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
-from email import encoders
+from email.mime.image import MIMEImage
+from email.generator import BytesGenerator
+from email import encoders, policy
+import io
+import os
 import smtplib
 import mimetypes
-from config.config import Config
+import tempfile
+from config.config import get_config
+
+# Messages up to this size stay in memory; larger ones spill over to a temporary file
+SPOOL_MAX_MEMORY = 4 * 1024 * 1024
+
+# Bytes handed to the socket per send() while streaming the message
+SEND_CHUNK_SIZE = 64 * 1024
+
+def compress_attachments(attachments, compression):
+    """Compress (filename, content, mime_type) attachments with gzip (per file) or zip (one archive)."""
+    if not attachments or compression == "none":
+        return attachments
+    
+    files = [(filename, content.encode('utf-8') if isinstance(content, str) else content)
+             for filename, content, _ in attachments]
+    if compression == "gzip":
+        import gzip
+        # mtime=0 keeps the output identical for identical reports
+        return [(filename + ".gz", gzip.compress(content, mtime=0), "application/gzip")
+                for filename, content in files]
+    
+    import zipfile
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for filename, content in files:
+            zf.writestr(filename, content)
+    archive_name = os.path.splitext(files[0][0])[0] + ".zip"
+    return [(archive_name, archive.getvalue(), "application/zip")]
+
+def build_message(subject, body, attachments=None, config=None, inline_images=None):
+    """
+    Build the complete MIME message for an HTML body and (filename, content, mime_type) attachments.
+    inline_images are (content_id, png_bytes) pairs referenced from the body as <img src="cid:content_id">.
+    The To header is added per recipient group when the message is sent.
+    """
+    config = config or get_config()
+    
+    # Create a multipart message.
+    msg = MIMEMultipart()
+    msg['Subject'] = subject
+    if config.EMAIL_USERNAME:
+        msg['From'] = config.EMAIL_USERNAME
+    
+    # Attach the HTML body, together with the images it references if there are any.
+    if inline_images:
+        related = MIMEMultipart('related')
+        related.attach(MIMEText(body, 'html'))
+        for content_id, content in inline_images:
+            image = MIMEImage(content, 'png')
+            image.add_header('Content-ID', f'<{content_id}>')
+            image.add_header('Content-Disposition', 'inline', filename=f'{content_id}.png')
+            related.attach(image)
+        msg.attach(related)
+    else:
+        msg.attach(MIMEText(body, 'html'))
+    
+    # Process attachments if provided.
+    attachments = compress_attachments(attachments, config.ATTACHMENT_COMPRESSION)
+    if attachments:
+        for filename, content, mime_type in attachments:
+            # If no MIME type is provided, guess it.
+            if not mime_type:
+                mime_type, _ = mimetypes.guess_type(filename)
+            main_type, sub_type = mime_type.split('/', 1)
+            part = MIMEBase(main_type, sub_type)
+            part.set_payload(content)
+            encoders.encode_base64(part)
+            part.add_header('Content-Disposition', 'attachment', filename=filename)
+            msg.attach(part)
+    
+    return msg
+
+def message_bytes(message):
+    """Encode a message with CRLF line endings, as sent over SMTP (and as written to .eml files)."""
+    return message.as_bytes(policy=policy.SMTP)
+
+def to_header(recipients):
+    return policy.SMTP.fold('To', ', '.join(recipients)).encode('ascii')
 
-def send_email(subject, body, attachments=None):
+def spool_message(message):
+    """Generate the message once into a spooled temporary file, without an in-memory string copy."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    if isinstance(message, bytes):
+        spool.write(message)
+    else:
+        BytesGenerator(spool, policy=policy.SMTP).flatten(message)
+    return spool
+
+def _stream_data(server, header, spool):
+    """Send the DATA of one envelope: the To header, then the spooled message, dot-stuffed."""
+    code, response = server.docmd('DATA')
+    if code != 354:
+        raise smtplib.SMTPDataError(code, response)
+    
+    spool.seek(0)
+    chunk = [header]
+    size = len(header)
+    for line in spool:
+        # Normalise line endings and escape lines starting with a dot (RFC 5321, 4.5.2)
+        line = line.rstrip(b'\r\n') + b'\r\n'
+        if line[:1] == b'.':
+            line = b'.' + line
+        chunk.append(line)
+        size += len(line)
+        if size >= SEND_CHUNK_SIZE:
+            server.send(b''.join(chunk))
+            chunk = []
+            size = 0
+    chunk.append(b'.\r\n')
+    server.send(b''.join(chunk))
+    
+    code, response = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
+
+def send_envelope(server, sender, recipients, spool):
+    """
+    Send the spooled message to one recipient group; refused addresses are reported, not fatal.
+    Returns the accepted recipients.
+    """
+    code, response = server.mail(sender)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, response, sender)
+    
+    refused = {}
+    for recipient in recipients:
+        code, response = server.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, response)
+    if len(refused) == len(recipients):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
+    
+    try:
+        _stream_data(server, to_header(recipients), spool)
+    except smtplib.SMTPDataError:
+        server.rset()
+        raise
+    for recipient, (code, response) in refused.items():
+        print(f"⚠️ {recipient} was refused by the mail server: {code} {response.decode(errors='replace')}")
+    return [recipient for recipient in recipients if recipient not in refused]
+
+def send_message(message, config=None):
+    """
+    Send a message built by build_message(), or its already encoded bytes, to every recipient group.
+    Returns the recipients the mail server accepted.
+    """
+    config = config or get_config()
+    if not config.EMAIL_GROUPS:
+        raise ValueError("EMAIL_TO has no recipients")
+    
+    with spool_message(message) as spool:
+        # Connect to the SMTP server and send one envelope per recipient group
+        server = smtplib.SMTP(config.EMAIL_SMTP, config.EMAIL_PORT)
+        try:
+            server.starttls()
+            server.login(config.EMAIL_USERNAME, config.EMAIL_PASSWORD)
+            accepted = {}
+            refused = {}
+            for recipients in config.EMAIL_GROUPS:
+                try:
+                    accepted.update(dict.fromkeys(send_envelope(server, config.EMAIL_USERNAME, recipients, spool)))
+                except smtplib.SMTPRecipientsRefused as e:
+                    # One group's bad addresses should not keep the report from the other groups
+                    refused.update(e.recipients)
+                    if len(config.EMAIL_GROUPS) > 1:
+                        print(f"❌ All recipients refused: {', '.join(e.recipients)}")
+            if not accepted:
+                raise smtplib.SMTPRecipientsRefused(refused)
+        finally:
+            server.quit()
+    return list(accepted)
+
+def send_email(subject, body, attachments=None, config=None, inline_images=None):
     email_sent = False  # Flag to track if email was sent
+    accepted = []
+    config = config or get_config()
     
     try:
-        # Create a multipart message.
-        msg = MIMEMultipart()
-        msg['Subject'] = subject
-        msg['From'] = Config.EMAIL_USERNAME
-        
-        # Handle multiple recipients including whitespace handling
-        recipients = [email.strip() for email in Config.EMAIL_TO.split(',')]
-        msg['To'] = ', '.join(recipients)
-        
-        # Attach the HTML body.
-        msg.attach(MIMEText(body, 'html'))
-        
-        # Process attachments if provided.
-        if attachments:
-            for filename, content, mime_type in attachments:
-                # If no MIME type is provided, guess it.
-                if not mime_type:
-                    mime_type, _ = mimetypes.guess_type(filename)
-                main_type, sub_type = mime_type.split('/', 1)
-                part = MIMEBase(main_type, sub_type)
-                part.set_payload(content)
-                encoders.encode_base64(part)
-                part.add_header('Content-Disposition', 'attachment', filename=filename)
-                msg.attach(part)
-                
-        # Connect to the SMTP server and send the email
-        server = smtplib.SMTP(Config.EMAIL_SMTP, Config.EMAIL_PORT)
-        server.starttls()
-        server.login(Config.EMAIL_USERNAME, Config.EMAIL_PASSWORD)
-        server.sendmail(Config.EMAIL_USERNAME, recipients, msg.as_string())
-        server.quit()
+        accepted = send_message(build_message(subject, body, attachments, config, inline_images), config)
         
         # If we get here without exceptions, the email was sent successfully
         email_sent = True
@@ -62,4 +215,4 @@ def send_email(subject, body, attachments=None):
     
     # Only print success message if email was actually sent
     if email_sent:
-        print(f"✅ Email sent successfully to {len(recipients)} recipients!")
+        print(f"✅ Email sent successfully to {len(accepted)} of {len(config.EMAIL_RECIPIENTS)} recipients!")
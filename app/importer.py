@@ -0,0 +1,272 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# Bulk import of historical readings:
+#
+#     python -m app.importer history.csv export.json capture.txt
+#
+# Supported inputs (chosen by file extension, or --format):
+#   csv   long format with timestamp, topic and value columns, or wide format with a
+#         timestamp column and one column per metric (e.g. a Solar Assistant export)
+#   json  a JSON array or JSON lines of {"timestamp", "topic", "value" or "state"} objects
+#   mqtt  raw captures with one "<epoch> <topic> <payload>" line per message,
+#         e.g. from mosquitto_sub -v -F '%U %t %p' -t 'solar_assistant/total/#'
+#
+# Rows are staged in a temporary table in one large transaction, deduplicated against the
+# existing readings by (topic, timestamp), then appended with the readings indexes dropped
+# and rebuilt afterwards. With STORAGE_MODE=monthly this last step runs once per month file,
+# each in its own transaction. Timestamps without a timezone are interpreted in the configured TZ.
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from itertools import islice
+from app.db import connect, init_db, create_indexes, drop_indexes, attach_partition, partition_keys, month_bounds
+from config.config import get_config, TOPIC_TEMPLATE
+from app.utils import parse_payload, parse_timestamp
+
+BATCH_SIZE = 50000
+
+# Indexes are dropped and rebuilt when the import adds at least 1/REBUILD_INDEX_RATIO of the
+# current table size; smaller imports insert into the existing indexes instead.
+REBUILD_INDEX_RATIO = 5
+
+TIMESTAMP_COLUMNS = ("timestamp", "time", "datetime", "date")
+
+def topic_for_column(column):
+    """Map a wide CSV column such as 'PV power (W)' or 'pv_power' to its full topic name."""
+    if "/" in column:
+        return column.strip()
+    name = re.sub(r"\s*\(.*?\)", "", column).strip().lower().replace(" ", "_")
+    return TOPIC_TEMPLATE.format(name)
+
+def read_csv(path, tz, stats):
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            print(f"⚠️ {path} is empty, nothing to import")
+            return
+        header = [column.strip() for column in header]
+        lowered = [column.lower() for column in header]
+        time_index = next((lowered.index(name) for name in TIMESTAMP_COLUMNS if name in lowered), 0)
+
+        if "topic" in lowered and ("value" in lowered or "state" in lowered):
+            topic_index = lowered.index("topic")
+            value_index = lowered.index("value") if "value" in lowered else lowered.index("state")
+            width = max(time_index, topic_index, value_index) + 1
+            for row in reader:
+                if len(row) < width:
+                    stats["skipped"] += 1
+                    continue
+                yield row[time_index], row[topic_index], row[value_index]
+            return
+
+        columns = [(i, topic_for_column(name)) for i, name in enumerate(header) if i != time_index]
+        for row in reader:
+            # Parsed once per row rather than once per metric column
+            try:
+                timestamp = parse_timestamp(row[time_index], tz)
+            except (IndexError, ValueError):
+                stats["skipped"] += 1
+                continue
+            for i, topic in columns:
+                if i < len(row) and row[i] != "":
+                    yield timestamp, topic, row[i]
+
+def read_json(path, tz, stats):
+    with open(path, encoding="utf-8") as f:
+        first = f.read(1)
+        while first.isspace():
+            first = f.read(1)
+        f.seek(0)
+        records = json.load(f) if first == "[" else (json.loads(line) for line in f if line.strip())
+        for record in records:
+            if not isinstance(record, dict):
+                stats["skipped"] += 1
+                continue
+            value = record["value"] if "value" in record else record.get("state", record.get("payload"))
+            yield record.get("timestamp"), record.get("topic"), value
+
+def read_mqtt_capture(path, tz, stats):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split(" ", 2)
+            if len(parts) == 3:
+                yield parts[0], parts[1], parts[2]
+            elif line.strip():
+                stats["skipped"] += 1
+
+READERS = {"csv": read_csv, "json": read_json, "mqtt": read_mqtt_capture}
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".json", ".jsonl", ".ndjson"):
+        return "json"
+    return "mqtt"
+
+def parse_rows(raw_rows, tz, stats):
+    """Normalise (timestamp, topic, value) rows, counting and skipping unparseable ones."""
+    for timestamp, topic, value in raw_rows:
+        if not topic:
+            stats["skipped"] += 1
+            continue
+        try:
+            try:
+                # Plain numbers are by far the most common, so skip the JSON attempt for them
+                value = float(value)
+            except ValueError:
+                value = float(parse_payload(value))
+            yield parse_timestamp(timestamp, tz), topic, value
+        except (TypeError, ValueError):
+            stats["skipped"] += 1
+
+def import_targets(conn, config):
+    """
+    Yield (schema, start, end) for each table the staged rows go to: the main readings table,
+    or with STORAGE_MODE=monthly each month partition, attached for the duration of its step.
+    """
+    first, last = conn.execute('SELECT MIN(timestamp), MAX(timestamp) FROM import_staging').fetchone()
+    if first is None:
+        return
+    if config.STORAGE_MODE != 'monthly':
+        yield 'main', first, last + 1
+        return
+    for key in partition_keys(first, last + 1):
+        start, end = month_bounds(key)
+        if conn.execute('SELECT 1 FROM import_staging WHERE timestamp >= ? AND timestamp < ? LIMIT 1',
+                        (start, end)).fetchone() is None:
+            continue
+        schema = attach_partition(conn, key, config, create=True)
+        yield schema, start, end
+        conn.execute(f'DETACH DATABASE {schema}')
+
+def import_files(paths, file_format=None, batch_size=BATCH_SIZE):
+    config = get_config()
+    init_db()
+    conn = connect(config)
+    conn.execute('PRAGMA cache_size = -65536')  # 64 MB page cache for the index rebuild
+    stats = {"read": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    def progress(label):
+        elapsed = time.perf_counter() - started
+        print(f"📥 {label}: {stats['read']} rows in {elapsed:.1f}s "
+              f"({stats['read'] / elapsed if elapsed else 0:.0f} rows/s)")
+
+    existing = inserted = 0
+    imported_parts = 0
+    try:
+        conn.execute('BEGIN')
+        conn.execute('''
+            CREATE TEMP TABLE import_staging (
+                timestamp INTEGER NOT NULL,
+                topic TEXT NOT NULL,
+                value REAL NOT NULL
+            )
+        ''')
+
+        for path in paths:
+            reader = READERS[file_format or detect_format(path)]
+            rows = parse_rows(reader(path, config.TZINFO, stats), config.TZINFO, stats)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                conn.executemany('INSERT INTO import_staging (timestamp, topic, value) VALUES (?, ?, ?)', batch)
+                stats["read"] += len(batch)
+                progress(os.path.basename(path))
+
+        conn.execute('CREATE INDEX temp.idx_import_staging ON import_staging (topic, timestamp)')
+        # Only the temporary staging table so far; readings are written per target table below
+        conn.commit()
+
+        for schema, start, end in import_targets(conn, config):
+            conn.execute('BEGIN')
+            # Deduplicate against existing readings while their (topic, timestamp) index is still there
+            existing += conn.execute(f'''
+                DELETE FROM import_staging
+                WHERE timestamp >= ? AND timestamp < ? AND EXISTS (
+                    SELECT 1 FROM {schema}.readings AS readings
+                    WHERE readings.topic = import_staging.topic
+                      AND readings.timestamp = import_staging.timestamp
+                )
+            ''', (start, end)).rowcount
+
+            # Rebuilding the indexes only pays off when the import is large relative to the table
+            new_rows = conn.execute('SELECT COUNT(*) FROM import_staging WHERE timestamp >= ? AND timestamp < ?',
+                                    (start, end)).fetchone()[0]
+            current_rows = conn.execute(f'SELECT COUNT(*) FROM {schema}.readings').fetchone()[0]
+            rebuild_indexes = new_rows * REBUILD_INDEX_RATIO >= current_rows
+            if rebuild_indexes:
+                drop_indexes(conn, schema)
+
+            # GROUP BY also removes duplicates within the imported files themselves
+            inserted += conn.execute(f'''
+                INSERT INTO {schema}.readings (timestamp, topic, value)
+                SELECT timestamp, topic, value FROM import_staging
+                WHERE timestamp >= ? AND timestamp < ?
+                GROUP BY topic, timestamp
+            ''', (start, end)).rowcount
+            if rebuild_indexes:
+                progress(f"Inserted {inserted} new readings, rebuilding indexes")
+                create_indexes(conn, schema)
+            conn.commit()
+            imported_parts += 1
+
+        print(f"🔍 {existing} rows were already in the database")
+        conn.execute('DROP TABLE import_staging')
+    except BaseException:
+        conn.rollback()
+        if imported_parts:
+            print(f"⚠️ {imported_parts} monthly partitions were imported before the error; "
+                  f"importing the same files again skips their readings.")
+        raise
+    finally:
+        conn.close()
+
+    # Cached chart buckets of the affected days are stale now
+    if inserted:
+        from app.charts import clear_cache
+        clear_cache(config)
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Imported {inserted} readings ({existing} already present, "
+          f"{stats['read'] - existing - inserted} duplicates in the input, {stats['skipped']} unparseable) "
+          f"in {elapsed:.1f}s ({stats['read'] / elapsed if elapsed else 0:.0f} rows/s)")
+    return inserted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.importer",
+                                     description="Bulk-load historical readings into the database.")
+    parser.add_argument("paths", nargs="+", help="CSV, JSON or MQTT capture files to import")
+    parser.add_argument("--format", choices=sorted(READERS), dest="file_format",
+                        help="input format (default: detected from each file's extension)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"rows per executemany batch (default: {BATCH_SIZE})")
+    args = parser.parse_args(argv)
+
+    try:
+        import_files(args.paths, args.file_format, args.batch_size)
+    except (OSError, ValueError) as e:
+        print(f"❌ Import failed: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# In-memory store of recent readings, fed by the MQTT ingest path and warmed from the
+# database at startup. "Today so far" queries (the daily report, a future dashboard) are
+# answered from here without disk I/O, using a fixed amount of memory per topic.
+
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from config.config import get_config
+from app.db import open_range
+from app.utils import local_now, build_day_table
+
+class TopicBuffer:
+    """
+    A fixed-size ring of (epoch, value) pairs for one topic, oldest first, plus running
+    min/max/sum for the current local day. Appends are O(1); readings must arrive in time order.
+    """
+    __slots__ = ("capacity", "times", "values", "head", "count", "evicted_until",
+                 "day_start", "day_count", "day_min", "day_max", "day_sum", "day_first", "day_last")
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0  # index of the oldest pair
+        self.count = 0
+        self.evicted_until = float('-inf')  # newest timestamp dropped from the ring
+        self.day_start = None
+        self.day_count = 0
+        self.day_min = self.day_max = self.day_sum = 0.0
+        self.day_first = self.day_last = 0.0
+
+    def append(self, timestamp, value, day_start):
+        if self.count == self.capacity:
+            self.evicted_until = self.times[self.head]
+            index = self.head
+            self.head = (self.head + 1) % self.capacity
+        else:
+            index = (self.head + self.count) % self.capacity
+            self.count += 1
+        self.times[index] = timestamp
+        self.values[index] = value
+
+        if day_start != self.day_start:
+            self.day_start = day_start
+            self.day_count = 0
+            self.day_sum = 0.0
+            self.day_min = self.day_max = self.day_first = value
+        self.day_count += 1
+        self.day_sum += value
+        self.day_last = value
+        if value < self.day_min:
+            self.day_min = value
+        if value > self.day_max:
+            self.day_max = value
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        # Logical (oldest-first) indexing over timestamps, so bisect works on the ring
+        return self.times[(self.head + i) % self.capacity]
+
+    def series(self, start, end):
+        """Return (times, values) lists for start <= timestamp < end."""
+        lo = bisect_left(self, start)
+        hi = bisect_left(self, end)
+        indices = [(self.head + i) % self.capacity for i in range(lo, hi)]
+        return [self.times[i] for i in indices], [self.values[i] for i in indices]
+
+class LiveStore:
+    """Per-topic ring buffers of recent readings, safe to share between the MQTT and scheduler threads."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffers = {}
+        self.warm_since = None  # readings from this epoch onwards are complete in memory
+        self._lock = threading.Lock()
+        self._day_start = None
+        self._day_end = None
+
+    def _current_day(self, timestamp):
+        # Day boundaries are only recomputed when a reading crosses local midnight
+        if self._day_start is None or not self._day_start <= timestamp < self._day_end:
+            tz = get_config().TZINFO
+            self._day_start, self._day_end = build_day_table(datetime.fromtimestamp(timestamp, tz), 1)
+        return self._day_start
+
+    def record(self, topic, timestamp, value):
+        with self._lock:
+            buffer = self.buffers.get(topic)
+            if buffer is None:
+                buffer = self.buffers[topic] = TopicBuffer(self.capacity)
+            buffer.append(timestamp, value, self._current_day(timestamp))
+
+    def warm(self, rows):
+        """Load (topic, timestamp, value) rows, ordered by timestamp, read from the database."""
+        with self._lock:
+            for topic, timestamp, value in rows:
+                buffer = self.buffers.get(topic)
+                if buffer is None:
+                    buffer = self.buffers[topic] = TopicBuffer(self.capacity)
+                buffer.append(timestamp, value, self._current_day(timestamp))
+
+    def covers(self, start):
+        """True if every reading since the epoch start is held in memory."""
+        with self._lock:
+            if self.warm_since is None or self.warm_since > start:
+                return False
+            return all(buffer.evicted_until < start for buffer in self.buffers.values())
+
+    def has_data_since(self, start):
+        with self._lock:
+            return any(buffer.count and buffer[buffer.count - 1] >= start for buffer in self.buffers.values())
+
+    def today_summary(self, topics=None):
+        """
+        Return {topic: {'min', 'max', 'avg', 'count', 'first', 'last'}} for the current local day,
+        for the given topics (default all). Topics without readings today are left out.
+        """
+        day_start = build_day_table(local_now(), 1)[0]
+        summary = {}
+        with self._lock:
+            for topic in (self.buffers if topics is None else topics):
+                buffer = self.buffers.get(topic)
+                if buffer is None or buffer.day_start != day_start or not buffer.day_count:
+                    continue
+                summary[topic] = {
+                    'min': buffer.day_min,
+                    'max': buffer.day_max,
+                    'avg': buffer.day_sum / buffer.day_count,
+                    'count': buffer.day_count,
+                    'first': buffer.day_first,
+                    'last': buffer.day_last,
+                }
+        return summary
+
+    def series(self, topic, start, end):
+        """Return (times, values) for one topic with start <= timestamp < end."""
+        with self._lock:
+            buffer = self.buffers.get(topic)
+            if buffer is None:
+                return [], []
+            return buffer.series(start, end)
+
+store = LiveStore(get_config().LIVE_BUFFER_SIZE)
+
+def warm_from_db():
+    """Fill the store with readings since local midnight yesterday, so today is fully covered."""
+    since = build_day_table(local_now() - timedelta(days=1), 1)[0]
+    conn = open_range(since, int(time.time()) + 1)
+    cursor = conn.execute('''
+        SELECT topic, timestamp, value FROM readings
+        WHERE timestamp >= ?
+        ORDER BY timestamp ASC
+    ''', (since,))
+    started = time.perf_counter()
+    rows = 0
+    while True:
+        batch = cursor.fetchmany(10000)
+        if not batch:
+            break
+        store.warm(batch)
+        rows += len(batch)
+    conn.close()
+    store.warm_since = since
+    print(f"🧠 Loaded {rows} recent readings into memory in {time.perf_counter() - started:.1f}s")
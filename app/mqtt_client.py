@@ -12,50 +12,133 @@ Thank you for your support!
 """
 
 import paho.mqtt.client as mqtt
-import json
+import sqlite3
+import time
 from app.db import save_reading
-from config.config import Config
+from app.spool import spool
+from app.utils import parse_payload
+from app.live_store import store as live_store
+from app.charts import CHART_METRICS
+from app.report_generator import ENERGY_METRICS
+from app import alerts
+from config.config import get_config, TOPIC_TEMPLATE
+
+# Session expiry requested for persistent MQTT v5 sessions (MQTT_CLEAN_SESSION=0)
+SESSION_EXPIRY = 7 * 24 * 3600
 
 client = None
+subscribed = set()
+# Topics whose non-numeric states were logged once and are skipped since
+ignored_topics = set()
+
+def subscription_topics(config):
+    """The topic filters to subscribe to: only what the reports, charts and alerts read, unless MQTT_SUBSCRIBE=all."""
+    if config.MQTT_SUBSCRIBE == "all":
+        topics = {"solar_assistant/total/#"}
+    else:
+        topics = {TOPIC_TEMPLATE.format(metric) for metric in ENERGY_METRICS}
+        topics |= config.SELECTED_TOPICS
+        topics |= {rule[0] for rule in config.ALERT_RULES}
+        if config.CHART_REPORT:
+            topics |= {TOPIC_TEMPLATE.format(metric) for metric, _, _ in CHART_METRICS}
+    topics |= set(config.MQTT_INVERTER_TOPICS)
+    if config.MQTT_SHARED_GROUP:
+        # The broker hands each message to one member of the group, so several ingest processes split the load
+        topics = {f"$share/{config.MQTT_SHARED_GROUP}/{topic}" for topic in topics}
+    return topics
+
+def subscribe(client, config):
+    """Bring the subscriptions in line with the given settings snapshot."""
+    global subscribed
+    topics = subscription_topics(config)
+    removed = subscribed - topics
+    if removed:
+        client.unsubscribe(sorted(removed))
+    if topics:
+        # Subscribing again to an existing filter is harmless and picks up a changed QoS
+        client.subscribe([(topic, config.MQTT_QOS) for topic in sorted(topics)])
+    subscribed = topics
+    print(f"📡 Subscribed to {len(topics)} topics (QoS {config.MQTT_QOS})")
 
-def on_connect(client, userdata, flags, rc):
+def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
         print("✅ Connected to MQTT Broker!")
-        # Subscribe to solar_assistant total topics
-        client.subscribe("solar_assistant/total/#")
-        print("📡 Subscribed to solar_assistant/total/#")
+        subscribe(client, get_config())
     else:
         print(f"❌ Failed to connect, return code {rc}")
 
 def on_message(client, userdata, msg):
-    payload = msg.payload.decode('utf-8')
-
+    topic = msg.topic
     try:
-        # First, try to parse as JSON
-        data = json.loads(payload)
-        if isinstance(data, dict) and 'state' in data:
-            state = data['state']
-        else:
-            # If no 'state' key, just store raw payload
-            state = float(payload)
-    except json.JSONDecodeError:
-        # If not JSON, assume raw value
-        state = float(payload)
+        value = float(parse_payload(msg.payload))
+    except (TypeError, ValueError) as e:
+        # Text states such as an inverter's "Solar/Battery" mode are not readings. An exception
+        # escaping this callback would stop the network loop, and with it all ingest.
+        if topic not in ignored_topics:
+            ignored_topics.add(topic)
+            print(f"⚠️ Ignoring non-numeric state on {topic}: {e}")
+        return
 
-    topic = msg.topic
-    save_reading(topic, state)
-    print(f"📝 Saved reading: {topic} = {state}")
+    timestamp = int(time.time())
 
+    # While earlier readings wait in the spool, new ones queue up behind them
+    if spool.pending:
+        if spool.append(topic, timestamp, value):
+            print(f"📝 Spooled reading: {topic} = {value}")
+    else:
+        try:
+            save_reading(topic, value, timestamp)
+            print(f"📝 Saved reading: {topic} = {value}")
+        except sqlite3.Error as e:
+            # Locked, full or mid-migration: keep the reading until the database recovers
+            print(f"⚠️ Could not save reading {topic}: {e}")
+            if spool.append(topic, timestamp, value):
+                print(f"📝 Spooled reading: {topic} = {value}")
+
+    # Keep the in-memory copy of recent readings current for "today so far" queries
+    live_store.record(topic, timestamp, value)
+
+    # Check the live alert thresholds for this topic
+    alerts.evaluate(topic, timestamp, value)
+
+
+def create_client(config):
+    options = {"client_id": config.MQTT_CLIENT_ID}
+    if config.MQTT_PROTOCOL == "v5":
+        options["protocol"] = mqtt.MQTTv5
+    else:
+        options["protocol"] = mqtt.MQTTv311
+        options["clean_session"] = config.MQTT_CLEAN_SESSION
+    # paho-mqtt 2.x asks which callback signatures are used; on_connect accepts both
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        options["callback_api_version"] = mqtt.CallbackAPIVersion.VERSION2
+    return mqtt.Client(**options)
+
+def reload_subscriptions(config):
+    """Apply changed METRIC_*, ALERT_* or MQTT_* topic settings after a config reload."""
+    if client is not None and client.is_connected():
+        subscribe(client, config)
 
 def start_mqtt():
     global client
-    client = mqtt.Client()
-    client.username_pw_set(Config.MQTT_USERNAME, Config.MQTT_PASSWORD)
+    config = get_config()
+    client = create_client(config)
+    client.username_pw_set(config.MQTT_USERNAME, config.MQTT_PASSWORD)
 
     client.on_connect = on_connect
     client.on_message = on_message
 
-    client.connect(Config.MQTT_BROKER, Config.MQTT_PORT, 60)
+    if config.MQTT_PROTOCOL == "v5":
+        from paho.mqtt.packettypes import PacketTypes
+        from paho.mqtt.properties import Properties
+        properties = None
+        if not config.MQTT_CLEAN_SESSION:
+            properties = Properties(PacketTypes.CONNECT)
+            properties.SessionExpiryInterval = SESSION_EXPIRY
+        client.connect(config.MQTT_BROKER, config.MQTT_PORT, 60,
+                       clean_start=config.MQTT_CLEAN_SESSION, properties=properties)
+    else:
+        client.connect(config.MQTT_BROKER, config.MQTT_PORT, 60)
 
     # Run network loop in the background
     client.loop_start()
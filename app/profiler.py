@@ -0,0 +1,151 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# Report profiling, enabled with REPORT_PROFILE=1 or `python -m app.report --profile`.
+#
+# Each pipeline stage is timed, and the report's database cursor is wrapped so every SQL
+# statement is recorded with its EXPLAIN QUERY PLAN, execution time (including fetching)
+# and row count. The result is written as JSON to data/profiles/, one file per report run.
+# Statements whose plan scans a readings table instead of searching an index are flagged.
+
+import json
+import os
+import re
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# Plan lines for a full scan of readings, including monthly partitions (p_2025_06.readings)
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?((?:\w+\.)?readings)\b')
+
+# Plan lines naming a subquery; in monthly mode `readings` is a view, and scanning the rows
+# its partition searches produce ("CO-ROUTINE readings" ... "SCAN readings") is no table scan
+SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\S+)')
+
+def is_full_scan(plan):
+    subqueries = {match.group(1) for match in map(SUBQUERY.match, plan) if match}
+    return any(match and match.group(1) not in subqueries for match in map(FULL_SCAN.match, plan))
+
+class ProfilingCursor:
+    """A sqlite3 cursor that records each statement in a Profile. Other attributes pass through."""
+
+    def __init__(self, cursor, profile):
+        self._cursor = cursor
+        self._profile = profile
+        self._query = None
+
+    def execute(self, sql, parameters=()):
+        plan = [row[3] for row in self._cursor.connection.execute('EXPLAIN QUERY PLAN ' + sql, parameters)]
+        self._query = self._profile.record_query(sql, plan)
+        started = time.perf_counter()
+        self._cursor.execute(sql, parameters)
+        self._query['seconds'] += time.perf_counter() - started
+        return self
+
+    def _fetch(self, method, *args):
+        # SQLite produces rows as they are fetched, so fetching is part of the statement's cost
+        started = time.perf_counter()
+        result = getattr(self._cursor, method)(*args)
+        if self._query is not None:
+            self._query['seconds'] += time.perf_counter() - started
+            if method == 'fetchone':
+                self._query['rows'] += result is not None
+            else:
+                self._query['rows'] += len(result)
+        return result
+
+    def fetchone(self):
+        return self._fetch('fetchone')
+
+    def fetchmany(self, size=None):
+        return self._fetch('fetchmany', *(() if size is None else (size,)))
+
+    def fetchall(self):
+        return self._fetch('fetchall')
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class Profile:
+    def __init__(self, name, tz=None):
+        self.name = name
+        self.started_at = datetime.now(tz) if tz else datetime.now().astimezone()
+        self.started = time.perf_counter()
+        self.stages = []
+        self.queries = []
+        self.warnings = []
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        """Time a pipeline stage; stages nest, e.g. fetch/energy."""
+        self._stack.append(name)
+        path = "/".join(self._stack)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({'stage': path, 'seconds': round(time.perf_counter() - started, 6)})
+            self._stack.pop()
+
+    def wrap(self, cursor):
+        return ProfilingCursor(cursor, self)
+
+    def record_query(self, sql, plan):
+        sql = " ".join(sql.split())
+        full_scan = is_full_scan(plan)
+        query = {
+            'stage': "/".join(self._stack),
+            'sql': sql,
+            'plan': plan,
+            'seconds': 0.0,
+            'rows': 0,
+            'full_scan': full_scan,
+        }
+        self.queries.append(query)
+        if full_scan:
+            self.warnings.append(f"Full scan of readings in {query['stage'] or 'report'}: {sql}")
+        return query
+
+    def write(self, config):
+        """Write the profile as JSON next to the database and print a short summary. Returns the path."""
+        total = time.perf_counter() - self.started
+        for query in self.queries:
+            query['seconds'] = round(query['seconds'], 6)
+        directory = os.path.join(os.path.dirname(os.path.abspath(config.DATABASE_PATH)), 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.name}-{self.started_at.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'report': self.name,
+                'started': self.started_at.isoformat(timespec='seconds'),
+                'total_seconds': round(total, 6),
+                'stages': self.stages,
+                'queries': self.queries,
+                'warnings': self.warnings,
+            }, f, indent=2)
+
+        sql_seconds = sum(query['seconds'] for query in self.queries)
+        print(f"🧪 Profile written to {path}: {total:.2f}s total, {len(self.queries)} queries taking {sql_seconds:.2f}s")
+        for entry in sorted(self.stages, key=lambda entry: -entry['seconds'])[:3]:
+            print(f"🧪   {entry['stage']}: {entry['seconds']:.3f}s")
+        for warning in self.warnings:
+            print(f"⚠️ {warning}")
+        return path
+
+def stage(profile, name):
+    """profile.stage(name), or a no-op when profiling is off (profile is None)."""
+    return profile.stage(name) if profile is not None else nullcontext()
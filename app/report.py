@@ -0,0 +1,53 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# One-shot report entry point for cron and manual runs:
+#
+#     python -m app.report --period monthly
+#     python -m app.report --period monthly --count 12 --output reports/
+#     python -m app.report --period monthly --profile
+#
+# Only the report pipeline is imported; MQTT and APScheduler are never loaded, and the
+# email stack is loaded lazily by the report generator when the email is sent.
+
+import argparse
+from app.report_generator import generate_and_send_report
+
+PERIODS = ("daily", "weekly", "monthly")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.report",
+                                     description="Generate and send a single Solar Assistant report.")
+    parser.add_argument("--period", choices=PERIODS, default="daily",
+                        help="report period to generate (default: daily)")
+    parser.add_argument("--count", type=int, default=1,
+                        help="number of consecutive periods to generate, latest first (default: 1)")
+    parser.add_argument("--workers", type=int,
+                        help="render processes for batches (default: one per CPU core)")
+    parser.add_argument("--output", metavar="DIR",
+                        help="write the reports as .eml files to DIR instead of emailing them")
+    parser.add_argument("--profile", action="store_true", default=None,
+                        help="profile the run and write the timings and query plans to data/profiles/")
+    args = parser.parse_args(argv)
+    if args.profile and (args.count > 1 or args.output):
+        parser.error("--profile applies to single reports, not batches")
+
+    if args.count > 1 or args.output:
+        # Imported only for batches, which need the process pool machinery
+        from app.batch_report import generate_reports_batch
+        generate_reports_batch(args.period, args.count, args.workers, args.output)
+    else:
+        generate_and_send_report(period=args.period, profile=args.profile)
+
+if __name__ == "__main__":
+    main()
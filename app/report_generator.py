@@ -11,124 +11,63 @@ https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
 Thank you for your support!
 """
 
-from datetime import datetime, timedelta
-import sqlite3
-import csv
-import io
-from app.emailer import send_email
-from config.config import Config
-from app.utils import get_selected_metrics
+# Reports run in two stages so batches can spread them over threads and processes:
+#   fetch_report_data()  I/O: queries SQLite (or the live store) into compact arrays
+#   render_report()      CPU: energy totals, HTML, CSV and charts, from the fetched data only
 
-DB_FILE = Config.DATABASE_PATH
+from datetime import timedelta
+from array import array
+from bisect import bisect_left
+import time
+from app.charts import CHART_WIDTH, CHART_HEIGHT, fetch_chart_buckets, render_charts
+from app.db import open_range
+from app.live_store import store as live_store
+from app.profiler import Profile, stage
+from config.config import get_config, TOPIC_TEMPLATE
+from app.utils import local_now, build_day_table
 
-def get_daily_data(cursor, date):
-    """
-    Get energy data for a specific day.
-    Returns the first and last readings of the day for each energy metric.
-    """
-    # Define the metrics we want to track
-    energy_metrics = [
-        'battery_energy_in',
-        'battery_energy_out',
-        'grid_energy_in',
-        'grid_energy_out',
-        'load_energy',
-        'pv_energy'
-    ]
-    
-    start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-    end = date.replace(hour=23, minute=59, second=59, microsecond=999999)
-    
-    results = {}
-    
-    for metric in energy_metrics:
-        # Get the first reading of the day
-        cursor.execute('''
-            SELECT value, timestamp FROM readings
-            WHERE topic = ? AND timestamp BETWEEN ? AND ?
-            ORDER BY timestamp ASC
-            LIMIT 1
-        ''', (f"solar_assistant/total/{metric}/state", start.isoformat(), end.isoformat()))
-        first_row = cursor.fetchone()
-        
-        # Get the last reading of the day
-        cursor.execute('''
-            SELECT value, timestamp FROM readings
-            WHERE topic = ? AND timestamp BETWEEN ? AND ?
-            ORDER BY timestamp DESC
-            LIMIT 1
-        ''', (f"solar_assistant/total/{metric}/state", start.isoformat(), end.isoformat()))
-        last_row = cursor.fetchone()
-        
-        if first_row and last_row:
-            first_value, first_timestamp = first_row
-            last_value, last_timestamp = last_row
-            
-            # Calculate the energy used during this day
-            daily_value = last_value - first_value
-            
-            # Store the result
-            results[metric] = {
-                'first': first_value,
-                'last': last_value,
-                'daily': daily_value,
-                'first_timestamp': first_timestamp,
-                'last_timestamp': last_timestamp
-            }
-        else:
-            # No data for this metric on this day
-            results[metric] = {
-                'first': 0.0,
-                'last': 0.0,
-                'daily': 0.0,
-                'first_timestamp': None,
-                'last_timestamp': None
-            }
-    
-    return results
+# Cumulative energy counters used for the daily totals in the CSV
+ENERGY_METRICS = [
+    'battery_energy_in',
+    'battery_energy_out',
+    'grid_energy_in',
+    'grid_energy_out',
+    'load_energy',
+    'pv_energy'
+]
 
-def generate_daily_report(cursor, date):
+# Number of days covered by each report period, ending with the report date
+PERIOD_DAYS = {"daily": 1, "weekly": 7, "monthly": 31}
+
+def fetch_energy_series(cursor, range_start, range_end):
     """
-    Generate a daily report with total energy values for the specified date.
+    Fetch the energy counters between two UTC epochs.
+    Returns {metric: (timestamps, values)} as compact arrays, ordered by timestamp.
     """
-    print(f"Generating daily report for {date.strftime('%Y-%m-%d')}...")
-    
-    # Define the metrics we want to track
-    energy_metrics = [
-        'battery_energy_in',
-        'battery_energy_out',
-        'grid_energy_in',
-        'grid_energy_out',
-        'load_energy',
-        'pv_energy'
-    ]
-    
-    day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-    day_end = date.replace(hour=23, minute=59, second=59, microsecond=999999)
-    
-    # Fetch all relevant data for the day in a single batch per metric
-    day_data = {}
-    for metric in energy_metrics:
+    series = {}
+    for metric in ENERGY_METRICS:
         print(f"Fetching data for {metric}...")
         cursor.execute('''
-            SELECT value, timestamp FROM readings
-            WHERE topic = ? AND timestamp BETWEEN ? AND ?
+            SELECT timestamp, value FROM readings
+            WHERE topic = ? AND timestamp >= ? AND timestamp < ?
             ORDER BY timestamp ASC
-        ''', (f"solar_assistant/total/{metric}/state", day_start.isoformat(), day_end.isoformat()))
+        ''', (TOPIC_TEMPLATE.format(metric), range_start, range_end))
         readings = cursor.fetchall()
+        series[metric] = (array('q', [r[0] for r in readings]), array('d', [r[1] for r in readings]))
         print(f"Found {len(readings)} readings for {metric}")
-        
-        if readings:
-            first_value = readings[0][0]
-            last_value = readings[-1][0]
-            daily_value = last_value - first_value
-            day_data[metric] = daily_value
-        else:
-            day_data[metric] = 0.0
-    
-    # Create a row for the CSV with just the daily totals
-    row = {
-        'Date': date.strftime('%Y-%m-%d'),
+    return series
+
+def fetch_live_energy_series(live, range_start, range_end):
+    """Same as fetch_energy_series, from the in-memory store."""
+    series = {}
+    for metric in ENERGY_METRICS:
+        timestamps, values = live.series(TOPIC_TEMPLATE.format(metric), range_start, range_end)
+        series[metric] = (array('q', map(int, timestamps)), array('d', values))
+    return series
+
+def energy_row(date_label, day_data):
+    return {
+        'Date': date_label,
         'Load (kWh)': round(day_data.get('load_energy', 0.0), 2),
         'Solar PV (kWh)': round(day_data.get('pv_energy', 0.0), 2),
         'Battery Charged (kWh)': round(day_data.get('battery_energy_in', 0.0), 2),
@@ -136,15 +75,14 @@ def generate_daily_report(cursor, date):
         'Grid Import (kWh)': round(day_data.get('grid_energy_in', 0.0), 2),
         'Grid Export (kWh)': round(day_data.get('grid_energy_out', 0.0), 2)
     }
-    
-    print("Daily report generation complete!")
-    return row
 
-def generate_weekly_report(cursor, end_date):
+def build_energy_rows(series, first_day, day_bounds, add_total=True):
     """
-    Generate a weekly report with daily rows and a total row at the bottom.
+    Build one CSV row per day from pre-fetched energy series, plus a total row at the bottom.
+    day_bounds are the UTC epochs of each local midnight (see build_day_table), so each
+    day's readings are found with two bisections on the timestamps.
     """
-    print("Starting weekly report generation...")
+    days = len(day_bounds) - 1
     rows = []
     totals = {
         'Load (kWh)': 0.0,
@@ -155,191 +93,32 @@ def generate_weekly_report(cursor, end_date):
         'Grid Export (kWh)': 0.0
     }
     
-    # Calculate the start date (7 days ago)
-    start_date = end_date - timedelta(days=6)
-    print(f"Generating weekly report from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
-    
-    # Define the metrics we want to track
-    energy_metrics = [
-        'battery_energy_in',
-        'battery_energy_out',
-        'grid_energy_in',
-        'grid_energy_out',
-        'load_energy',
-        'pv_energy'
-    ]
-    
-    # Pre-fetch all energy metrics for the week to reduce database queries
-    week_start = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    week_end = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-    
-    # Fetch all relevant data for the entire week
-    all_readings = {}
-    for metric in energy_metrics:
-        print(f"Fetching data for {metric}...")
-        cursor.execute('''
-            SELECT value, timestamp FROM readings
-            WHERE topic = ? AND timestamp BETWEEN ? AND ?
-            ORDER BY timestamp ASC
-        ''', (f"solar_assistant/total/{metric}/state", week_start.isoformat(), week_end.isoformat()))
-        all_readings[metric] = cursor.fetchall()
-        print(f"Found {len(all_readings[metric])} readings for {metric}")
-    
-    # Process each day of the week
-    current_date = start_date
-    days_processed = 0
-    
-    while current_date <= end_date:
-        print(f"Processing day {current_date.strftime('%Y-%m-%d')} ({days_processed+1}/7)...")
+    for i in range(days):
+        current_date = first_day + timedelta(days=i)
+        if days > 1:
+            print(f"Processing day {current_date.strftime('%Y-%m-%d')} ({i+1}/{days})...")
         
-        day_start = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = current_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        # Get data for this day from pre-fetched readings
+        # Energy used during the day is the last counter reading minus the first
         day_data = {}
-        for metric in energy_metrics:
-            # Filter readings for this day
-            day_readings = [r for r in all_readings[metric] 
-                           if day_start.isoformat() <= r[1] <= day_end.isoformat()]
-            
-            if day_readings:
-                first_value = day_readings[0][0]
-                last_value = day_readings[-1][0]
-                daily_value = last_value - first_value
-                day_data[metric] = daily_value
-            else:
-                day_data[metric] = 0.0
-        
-        # Create a row for this day
-        daily_row = {
-            'Date': current_date.strftime('%Y-%m-%d'),
-            'Load (kWh)': round(day_data.get('load_energy', 0.0), 2),
-            'Solar PV (kWh)': round(day_data.get('pv_energy', 0.0), 2),
-            'Battery Charged (kWh)': round(day_data.get('battery_energy_in', 0.0), 2),
-            'Battery Discharged (kWh)': round(day_data.get('battery_energy_out', 0.0), 2),
-            'Grid Import (kWh)': round(day_data.get('grid_energy_in', 0.0), 2),
-            'Grid Export (kWh)': round(day_data.get('grid_energy_out', 0.0), 2)
-        }
+        for metric, (timestamps, values) in series.items():
+            lo = bisect_left(timestamps, day_bounds[i])
+            hi = bisect_left(timestamps, day_bounds[i + 1])
+            day_data[metric] = values[hi - 1] - values[lo] if hi > lo else 0.0
         
+        daily_row = energy_row(current_date.strftime('%Y-%m-%d'), day_data)
         rows.append(daily_row)
         
         # Add to totals
         for key in totals.keys():
             totals[key] += daily_row[key]
-        
-        current_date += timedelta(days=1)
-        days_processed += 1
     
-    print("Finished processing all days, adding total row...")
+    if add_total:
+        print("Finished processing all days, adding total row...")
+        total_row = {'Date': 'Total'}
+        for key, value in totals.items():
+            total_row[key] = round(value, 2)
+        rows.append(total_row)
     
-    # Add a total row
-    total_row = {'Date': 'Total'}
-    for key, value in totals.items():
-        total_row[key] = round(value, 2)
-    
-    rows.append(total_row)
-    print("Weekly report generation complete!")
-    return rows
-
-def generate_monthly_report(cursor, end_date):
-    """
-    Generate a monthly report with daily rows and a total row at the bottom.
-    """
-    print("Starting monthly report generation...")
-    rows = []
-    totals = {
-        'Load (kWh)': 0.0,
-        'Solar PV (kWh)': 0.0,
-        'Battery Charged (kWh)': 0.0,
-        'Battery Discharged (kWh)': 0.0,
-        'Grid Import (kWh)': 0.0,
-        'Grid Export (kWh)': 0.0
-    }
-    
-    # Calculate the start date (30 days ago)
-    start_date = end_date - timedelta(days=30)
-    print(f"Generating monthly report from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
-    
-    # Generate daily reports for each day of the month
-    current_date = start_date
-    days_processed = 0
-    
-    # Pre-fetch all energy metrics for the month to reduce database queries
-    month_start = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-    month_end = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-    
-    # Define the metrics we want to track
-    energy_metrics = [
-        'battery_energy_in',
-        'battery_energy_out',
-        'grid_energy_in',
-        'grid_energy_out',
-        'load_energy',
-        'pv_energy'
-    ]
-    
-    # Fetch all relevant data for the entire month
-    all_readings = {}
-    for metric in energy_metrics:
-        print(f"Fetching data for {metric}...")
-        cursor.execute('''
-            SELECT value, timestamp FROM readings
-            WHERE topic = ? AND timestamp BETWEEN ? AND ?
-            ORDER BY timestamp ASC
-        ''', (f"solar_assistant/total/{metric}/state", month_start.isoformat(), month_end.isoformat()))
-        all_readings[metric] = cursor.fetchall()
-        print(f"Found {len(all_readings[metric])} readings for {metric}")
-    
-    while current_date <= end_date:
-        print(f"Processing day {current_date.strftime('%Y-%m-%d')} ({days_processed+1}/31)...")
-        
-        day_start = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = current_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        # Get data for this day from pre-fetched readings
-        day_data = {}
-        for metric in energy_metrics:
-            # Filter readings for this day
-            day_readings = [r for r in all_readings[metric] 
-                           if day_start.isoformat() <= r[1] <= day_end.isoformat()]
-            
-            if day_readings:
-                first_value = day_readings[0][0]
-                last_value = day_readings[-1][0]
-                daily_value = last_value - first_value
-                day_data[metric] = daily_value
-            else:
-                day_data[metric] = 0.0
-        
-        # Create a row for this day
-        daily_row = {
-            'Date': current_date.strftime('%Y-%m-%d'),
-            'Load (kWh)': round(day_data.get('load_energy', 0.0), 2),
-            'Solar PV (kWh)': round(day_data.get('pv_energy', 0.0), 2),
-            'Battery Charged (kWh)': round(day_data.get('battery_energy_in', 0.0), 2),
-            'Battery Discharged (kWh)': round(day_data.get('battery_energy_out', 0.0), 2),
-            'Grid Import (kWh)': round(day_data.get('grid_energy_in', 0.0), 2),
-            'Grid Export (kWh)': round(day_data.get('grid_energy_out', 0.0), 2)
-        }
-        
-        rows.append(daily_row)
-        
-        # Add to totals
-        for key in totals.keys():
-            totals[key] += daily_row[key]
-        
-        current_date += timedelta(days=1)
-        days_processed += 1
-    
-    print("Finished processing all days, adding total row...")
-    
-    # Add a total row
-    total_row = {'Date': 'Total'}
-    for key, value in totals.items():
-        total_row[key] = round(value, 2)
-    
-    rows.append(total_row)
-    print("Monthly report generation complete!")
     return rows
 
 def create_csv_content(rows):
@@ -349,6 +128,10 @@ def create_csv_content(rows):
     if not rows:
         return ""
     
+    # Imported here so report runs without a CSV attachment don't pay for csv/io at startup
+    import csv
+    import io
+    
     output = io.StringIO()
     writer = csv.DictWriter(output, fieldnames=rows[0].keys())
     writer.writeheader()
@@ -396,119 +179,166 @@ def create_html_table(rows):
     
     return html
 
-def generate_and_send_report(period="daily"):
+def describe_period(period, now):
+    """Return the first day, number of days and display strings for a report ending on now."""
+    days = PERIOD_DAYS.get(period, 1)  # Default to daily
+    start = (now - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    if days == 1:
+        date_range_str = f"{now.strftime('%Y-%m-%d')}"
+        email_subject = f"Solar Report - {date_range_str} (Daily Report)"
+        html_title = f"Solar Report for {date_range_str} (Daily Report)"
+    elif period == "weekly":
+        date_range_str = f"{start.strftime('%Y-%m-%d')} to {now.strftime('%Y-%m-%d')}"
+        email_subject = f"Solar Report - {date_range_str} (Weekly Report)"
+        html_title = f"Solar Report for Week of {date_range_str} (Weekly Report)"
+    else:
+        date_range_str = f"{start.strftime('%Y-%m-%d')} to {now.strftime('%Y-%m-%d')}"
+        email_subject = f"Solar Report - {date_range_str} (Monthly Report)"
+        html_title = f"Solar Report for Month of {date_range_str} (Monthly Report)"
+    return start, days, email_subject, html_title
+
+def fetch_report_data(period, now, config, live=None, profile=None):
     """
-    Generates and sends an HTML report (with a CSV attachment) for the specified period.
-    'period' can be "daily", "weekly", or "monthly".
-    
-    The HTML report shows a summary table using only the metrics the user has configured (via METRIC_* in the .env),
-    and the CSV provides energy totals for the reporting period.
+    The I/O stage of a report: everything render_report() needs, as plain picklable data
+    (energy series as arrays rather than lists of row tuples). Returns None if the period has no data.
+    With a profile (see app.profiler), each query and sub-stage is recorded in it.
     """
-    print(f"📋 Starting {period} report generation...")
-    try:
-        # For the HTML report: only the user-selected metrics will be summarized as before
-        selected_metrics = get_selected_metrics()
-        
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        now = datetime.now()
-
-        # Determine date range based on the report period (for both reports)
-        if period == "daily":
-            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-            date_range_str = f"{now.strftime('%Y-%m-%d')}"
-            report_title = f"Daily Solar Report - {date_range_str}"
-            email_subject = f"Solar Report - {date_range_str} (Daily Report)"
-            html_title = f"Solar Report for {date_range_str} (Daily Report)"
-        elif period == "weekly":
-            start = (now - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
-            end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-            date_range_str = f"{start.strftime('%Y-%m-%d')} to {now.strftime('%Y-%m-%d')}"
-            report_title = f"Weekly Solar Report - {date_range_str}"
-            email_subject = f"Solar Report - {date_range_str} (Weekly Report)"
-            html_title = f"Solar Report for Week of {date_range_str} (Weekly Report)"
-        elif period == "monthly":
-            start = (now - timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0)
-            end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-            date_range_str = f"{start.strftime('%Y-%m-%d')} to {now.strftime('%Y-%m-%d')}"
-            report_title = f"Monthly Solar Report - {date_range_str}"
-            email_subject = f"Solar Report - {date_range_str} (Monthly Report)"
-            html_title = f"Solar Report for Month of {date_range_str} (Monthly Report)"
-        else:
-            # Default to daily
-            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            end = now.replace(hour=23, minute=59, second=59, microsecond=999999)
-            date_range_str = f"{now.strftime('%Y-%m-%d')}"
-            report_title = f"Daily Solar Report - {date_range_str}"
-            email_subject = f"Solar Report - {date_range_str} (Daily Report)"
-            html_title = f"Solar Report for {date_range_str} (Daily Report)"
-        
-        print(f"📅 Looking for data from {start.strftime('%Y-%m-%d %H:%M:%S')} to {end.strftime('%Y-%m-%d %H:%M:%S')}")
-        
-        # Get all the readings for the original email format
-        cursor.execute('''
-            SELECT topic, value, timestamp FROM readings
-            WHERE timestamp BETWEEN ? AND ?
-        ''', (start.isoformat(), end.isoformat()))
-        rows = cursor.fetchall()
-        
-        if not rows:
+    start, days, email_subject, html_title = describe_period(period, now)
+    
+    # Convert the local range to UTC epochs once; the end is the next local midnight (exclusive)
+    day_bounds = build_day_table(start, days)
+    range_start, range_end = day_bounds[0], day_bounds[-1]
+    
+    print(f"📅 Looking for data from {start.strftime('%Y-%m-%d %H:%M:%S')} to {now.strftime('%Y-%m-%d')} 23:59:59 ({now.tzname()})")
+    
+    # For the HTML report: only the user-selected metrics will be summarized as before
+    selected_topics = sorted(config.SELECTED_TOPICS)
+    
+    # Summary statistics for the HTML email body: {short_topic: (max, min, avg)}
+    stats_email = {}
+    
+    # Today's readings are already in memory when the ingest process is running
+    if live is not None and days == 1 and live.covers(range_start) and range_start <= time.time() < range_end:
+        if not live.has_data_since(range_start):
             print(f"⚠️ No data for the {period} period, skipping report.")
-            return
-        
-        print(f"✅ Found {len(rows)} rows of data.")
-        
-        # Generate energy report data for CSV attachment
-        if period == "daily":
-            report_rows = [generate_daily_report(cursor, now)]
-        elif period == "weekly":
-            report_rows = generate_weekly_report(cursor, now)
-        elif period == "monthly":
-            report_rows = generate_monthly_report(cursor, now)
-        else:
-            # Default to daily
-            report_rows = [generate_daily_report(cursor, now)]
-        
+            return None
+        
+        for topic, stats in live.today_summary(selected_topics).items():
+            short_topic = topic.split("/")[-2]
+            stats_email[short_topic] = (stats['max'], stats['min'], stats['avg'])
+        print(f"✅ Using in-memory readings for {len(stats_email)} metrics.")
+        
+        with stage(profile, "energy"):
+            series = fetch_live_energy_series(live, range_start, range_end)
+        with stage(profile, "charts"):
+            charts = fetch_chart_buckets(None, day_bounds, config, int(time.time()), live) if config.CHART_REPORT else None
+    else:
+        # Only the monthly partitions overlapping the range are opened (STORAGE_MODE=monthly)
+        conn = open_range(range_start, range_end, config)
+        cursor = conn.cursor()
+        if profile is not None:
+            cursor = profile.wrap(cursor)
+        
+        with stage(profile, "summary"):
+            cursor.execute('''
+                SELECT 1 FROM readings
+                WHERE timestamp >= ? AND timestamp < ?
+                LIMIT 1
+            ''', (range_start, range_end))
+            if cursor.fetchone() is None:
+                conn.close()
+                print(f"⚠️ No data for the {period} period, skipping report.")
+                return None
+            
+            # Summarise the selected metrics in SQL rather than fetching every reading
+            topic_placeholders = ", ".join("?" * len(selected_topics))
+            cursor.execute(f'''
+                SELECT topic, MAX(value), MIN(value), AVG(value), COUNT(*) FROM readings
+                WHERE topic IN ({topic_placeholders}) AND timestamp >= ? AND timestamp < ?
+                GROUP BY topic
+            ''', (*selected_topics, range_start, range_end))
+            row_count = 0
+            for topic, max_val, min_val, avg_val, count in cursor.fetchall():
+                # For example, topic: "solar_assistant/total/battery_state_of_charge/state"
+                short_topic = topic.split("/")[-2]  # 'battery_state_of_charge'
+                stats_email[short_topic] = (max_val, min_val, avg_val)
+                row_count += count
+        
+        print(f"✅ Found {row_count} rows of data.")
+        
+        # Energy counters for the CSV attachment
+        with stage(profile, "energy"):
+            series = fetch_energy_series(cursor, range_start, range_end)
+        
+        # Min/max buckets for the inline charts
+        with stage(profile, "charts"):
+            charts = fetch_chart_buckets(cursor, day_bounds, config, int(time.time()), live) if config.CHART_REPORT else None
         conn.close()
-        
-        # Build summary statistics for the HTML email body (original format)
-        stats_email = {}
-        for topic, value, ts in rows:
-            # For example, topic: "solar_assistant/total/battery_state_of_charge/state"
-            short_topic = topic.split("/")[-2]  # 'battery_state_of_charge'
-            if short_topic not in selected_metrics:
-                continue
-            stats_email.setdefault(short_topic, []).append(value)
-        
-        # Define friendly names (with units) for display (original format)
-        metric_names = {
-            "battery_power": "Battery Power (W)",
-            "battery_state_of_charge": "Battery SOC (%)",
-            "battery_temperature": "Battery Temperature (°C)",
-            "bus_voltage": "Bus Voltage (V)",
-            "grid_frequency": "Grid Frequency (Hz)",
-            "grid_power": "Grid Power (W)",
-            "grid_voltage": "Grid Voltage (V)",
-            "load_percentage": "Load Percentage (%)",
-            "load_power": "Load Power (W)",
-            "pv_power": "PV Power (W)",
-            "pv_voltage": "PV Voltage (V)",
-            "pv_current": "PV Current (A)",
-            "battery_voltage": "Battery Voltage (V)",
-            "battery_current": "Battery Current (A)",
-            "battery_charge_power_from_ac": "Battery Charge Power from AC (W)",
-            # If you have cumulative energy counters, you could include them too:
-            "battery_energy_in": "Battery Energy In (kWh)",
-            "battery_energy_out": "Battery Energy Out (kWh)",
-            "grid_energy_in": "Grid Energy In (kWh)",
-            "grid_energy_out": "Grid Energy Out (kWh)",
-            "load_energy": "Load Energy (kWh)",
-            "pv_energy": "PV Energy (kWh)"
-        }
-        
-        # Build the HTML email body with the original summary table format
-        html = f"""
+    
+    return {
+        'period': period,
+        'date': now.strftime('%Y-%m-%d'),
+        'first_day': start,
+        'day_bounds': day_bounds,
+        'email_subject': email_subject,
+        'html_title': html_title,
+        'stats': stats_email,
+        'energy': series,
+        'charts': charts,
+        'generated_at': int(time.time()),
+    }
+
+def render_report(data, config, profile=None):
+    """
+    The CPU stage of a report: builds the energy rows, HTML body and CSV attachment
+    from fetch_report_data() output. Returns (subject, html, attachments, inline_images).
+    """
+    period = data['period']
+    html_title = data['html_title']
+    stats_email = data['stats']
+    
+    # Render the inline charts; the images of a single finished day are cached
+    charts = []
+    if data['charts']:
+        day_bounds = data['day_bounds']
+        single_closed_day = day_bounds[0] if len(day_bounds) == 2 and day_bounds[1] <= data['generated_at'] else None
+        with stage(profile, "charts"):
+            charts = render_charts(data['charts'], config, single_closed_day)
+    sparklines = {cid: spark for cid, _, _, spark in charts}
+    
+    # Generate energy report data for CSV attachment
+    with stage(profile, "energy_rows"):
+        report_rows = build_energy_rows(data['energy'], data['first_day'], data['day_bounds'],
+                                        add_total=len(data['day_bounds']) > 2)
+    
+    # Define friendly names (with units) for display (original format)
+    metric_names = {
+        "battery_power": "Battery Power (W)",
+        "battery_state_of_charge": "Battery SOC (%)",
+        "battery_temperature": "Battery Temperature (°C)",
+        "bus_voltage": "Bus Voltage (V)",
+        "grid_frequency": "Grid Frequency (Hz)",
+        "grid_power": "Grid Power (W)",
+        "grid_voltage": "Grid Voltage (V)",
+        "load_percentage": "Load Percentage (%)",
+        "load_power": "Load Power (W)",
+        "pv_power": "PV Power (W)",
+        "pv_voltage": "PV Voltage (V)",
+        "pv_current": "PV Current (A)",
+        "battery_voltage": "Battery Voltage (V)",
+        "battery_current": "Battery Current (A)",
+        "battery_charge_power_from_ac": "Battery Charge Power from AC (W)",
+        # If you have cumulative energy counters, you could include them too:
+        "battery_energy_in": "Battery Energy In (kWh)",
+        "battery_energy_out": "Battery Energy Out (kWh)",
+        "grid_energy_in": "Grid Energy In (kWh)",
+        "grid_energy_out": "Grid Energy Out (kWh)",
+        "load_energy": "Load Energy (kWh)",
+        "pv_energy": "PV Energy (kWh)"
+    }
+    
+    # Build the HTML email body with the original summary table format
+    html = f"""
 <html>
   <head>
     <style>
@@ -534,27 +364,39 @@ def generate_and_send_report(period="daily"):
         <th>Max</th>
         <th>Min</th>
         <th>Avg</th>
+        {'<th>Trend</th>' if charts else ''}
       </tr>
 """
-        for short_topic, values in stats_email.items():
-            if values:  # Only include metrics that have values
-                max_val = max(values)
-                min_val = min(values)
-                avg_val = sum(values) / len(values)
-                friendly = metric_names.get(short_topic, short_topic.replace("_", " ").title())
-                html += f"""
+    for short_topic, (max_val, min_val, avg_val) in stats_email.items():
+        friendly = metric_names.get(short_topic, short_topic.replace("_", " ").title())
+        trend = ""
+        if charts:
+            cid = f"chart_{short_topic}"
+            trend = f'<td><img src="cid:{cid}_spark" alt="{friendly} trend"></td>' if cid in sparklines else "<td></td>"
+        html += f"""
       <tr>
         <td>{friendly}</td>
         <td>{round(max_val, 2)}</td>
         <td>{round(min_val, 2)}</td>
         <td>{round(avg_val, 2)}</td>
+        {trend}
       </tr>
 """
-        
-        # Add the legend explanation
-        html += """
+    
+    # Add the legend explanation
+    html += """
     </table>
     <br>
+"""
+    
+    # Add the charts below the summary table
+    for cid, title, _, _ in charts:
+        html += f"""
+    <h4>{title}</h4>
+    <img src="cid:{cid}" alt="{title}" width="{CHART_WIDTH}" height="{CHART_HEIGHT}">
+"""
+    
+    html += """
     <h4>Legend / Explanation:</h4>
     <ul style="font-size:12px;">
       <li><strong>Battery Power (W):</strong> Positive means charging; negative means discharging.</li>
@@ -574,34 +416,90 @@ def generate_and_send_report(period="daily"):
       <li><strong>Battery Charge Power from AC (W):</strong> Power drawn from AC to charge the battery.</li>
     </ul>
 """
-        
-        # Prepare period info for CSV attachments
-        period_info = f"<p style=\"font-size:12px;\">The CSV attachment contains detailed energy totals for the {period.capitalize()} period.</p>"
-        
-        # Add CSV info only if CSV_REPORT is enabled
-        if Config.CSV_REPORT == "1":
-            html += period_info
-        
-        # Add footer
-        html += """
+    
+    # Prepare period info for CSV attachments
+    period_info = f"<p style=\"font-size:12px;\">The CSV attachment contains detailed energy totals for the {period.capitalize()} period.</p>"
+    
+    # Add CSV info only if CSV_REPORT is enabled
+    if config.CSV_REPORT:
+        html += period_info
+    
+    # Add footer
+    html += """
     <p style="font-size:12px;color:gray;">Generated automatically by Email Scheduler for Solar Assistant 🌞</p>
   </body>
 </html>
 """
+    
+    # Create CSV attachment with energy totals only if CSV_REPORT is enabled
+    attachments = None
+    if config.CSV_REPORT:
+        csv_content = create_csv_content(report_rows)
+        filename = f"solar_report_{period}_{data['date']}.csv"
+        attachments = [(filename, csv_content, "text/csv")]
+    
+    # The chart images, referenced from the HTML by Content-ID
+    inline_images = []
+    for cid, _, chart_png, sparkline_png in charts:
+        inline_images.append((cid, chart_png))
+        # Sparklines only for metrics that are also in the summary table
+        if f"cid:{cid}_spark" in html:
+            inline_images.append((f"{cid}_spark", sparkline_png))
+    
+    return data['email_subject'], html, attachments, inline_images
+
+def render_report_message(data, config):
+    """Render a report and encode it as a complete MIME message; runs in batch worker processes."""
+    from app.emailer import build_message, message_bytes
+    subject, html, attachments, inline_images = render_report(data, config)
+    return subject, message_bytes(build_message(subject, html, attachments, config, inline_images))
+
+def generate_and_send_report(period="daily", profile=None):
+    """
+    Generates and sends an HTML report (with a CSV attachment) for the specified period.
+    'period' can be "daily", "weekly", or "monthly".
+    
+    The HTML report shows a summary table using only the metrics the user has configured (via METRIC_* in the .env),
+    and the CSV provides energy totals for the reporting period.
+    
+    With profile=True (or REPORT_PROFILE=1 when profile is None) the run is profiled and the
+    profile is written to data/profiles/.
+    """
+    print(f"📋 Starting {period} report generation...")
+    profile_requested, profile = profile, None
+    try:
+        # One settings snapshot for the whole run, even if the config is reloaded meanwhile
+        config = get_config()
+        if config.REPORT_PROFILE if profile_requested is None else profile_requested:
+            profile = Profile(period, config.TZINFO)
+        now = local_now(config)
+        
+        with stage(profile, "fetch"):
+            data = fetch_report_data(period, now, config, live=live_store, profile=profile)
+        if data is None:
+            return
         
-        # Create CSV attachment with energy totals only if CSV_REPORT is enabled
-        attachments = None
-        if Config.CSV_REPORT == "1":
-            csv_content = create_csv_content(report_rows)
-            filename = f"solar_report_{period}_{now.strftime('%Y-%m-%d')}.csv"
-            attachments = [(filename, csv_content, "text/csv")]
+        with stage(profile, "render"):
+            email_subject, html, attachments, inline_images = render_report(data, config, profile)
         
         print("📤 Sending email...")
-        # Send email and get result - no printing of success message here
-        email_success = send_email(subject=email_subject,
-                                  body=html,
-                                  attachments=attachments)
-        # No success message here since emailer.py will handle that
+        with stage(profile, "send"):
+            # The email stack (email.mime, smtplib) is only loaded once there is something to send
+            from app.emailer import send_email
+            # Send email and get result - no printing of success message here
+            email_success = send_email(subject=email_subject,
+                                      body=html,
+                                      attachments=attachments,
+                                      config=config,
+                                      inline_images=inline_images)
+            # No success message here since emailer.py will handle that
 
     except Exception as e:
         print(f"❌ Error generating report: {e}")
+    finally:
+        if profile is not None:
+            # A profile that cannot be written must not hide the report's own outcome
+            try:
+                profile.write(config)
+            except Exception as e:
+                print(f"❌ Error writing report profile: {e}")
@@ -12,59 +12,94 @@ Thank you for your support!
 """
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
 from app.report_generator import generate_and_send_report
-from config.config import Config
+from app.spool import replay_pending
+from app.db import prune_partitions
+from config.config import get_config
 
 scheduler = BackgroundScheduler()
 
-def schedule_reports():
+# Seconds between attempts to replay spooled readings
+SPOOL_REPLAY_INTERVAL = 30
+
+def schedule_reports(config=None):
+    """Add, update or remove the report jobs to match the given (or current) settings snapshot."""
+    config = config or get_config()
+
     # Schedule Daily Report
-    if Config.REPORT_DAILY == "1":
-        daily_time = Config.REPORT_DAILY_TIME  # expected in HH:MM format
-        hour, minute = map(int, daily_time.split(":"))
+    if config.REPORT_DAILY:
+        hour, minute = config.REPORT_DAILY_TIME  # validated HH:MM
         scheduler.add_job(
             lambda: generate_and_send_report(period="daily"),
             trigger="cron",
             hour=hour,
             minute=minute,
+            timezone=config.TZINFO,
             id="daily_report",
             replace_existing=True
         )
-        print(f"⏰ Daily report scheduled for {daily_time}")
+        print(f"⏰ Daily report scheduled for {hour:02d}:{minute:02d}")
+    elif scheduler.get_job("daily_report"):
+        scheduler.remove_job("daily_report")
+        print("⏰ Daily report disabled")
 
     # Schedule Weekly Report (runs on Monday)
-    if Config.REPORT_WEEKLY == "1":
-        weekly_time = Config.REPORT_WEEKLY_TIME  # expected in HH:MM format
-        hour, minute = map(int, weekly_time.split(":"))
+    if config.REPORT_WEEKLY:
+        hour, minute = config.REPORT_WEEKLY_TIME  # validated HH:MM
         scheduler.add_job(
             lambda: generate_and_send_report(period="weekly"),
             trigger="cron",
             day_of_week="mon",  
             hour=hour,
             minute=minute,
+            timezone=config.TZINFO,
             id="weekly_report",
             replace_existing=True
         )
-        print(f"⏰ Weekly report scheduled for {weekly_time} on Monday")
+        print(f"⏰ Weekly report scheduled for {hour:02d}:{minute:02d} on Monday")
+    elif scheduler.get_job("weekly_report"):
+        scheduler.remove_job("weekly_report")
+        print("⏰ Weekly report disabled")
 
     # Schedule Monthly Report (runs on the 1st day of each month)
-    if Config.REPORT_MONTHLY == "1":
-        monthly_time = Config.REPORT_MONTHLY_TIME  # expected in HH:MM format
-        hour, minute = map(int, monthly_time.split(":"))
+    if config.REPORT_MONTHLY:
+        hour, minute = config.REPORT_MONTHLY_TIME  # validated HH:MM
         scheduler.add_job(
             lambda: generate_and_send_report(period="monthly"),
             trigger="cron",
             day=1,
             hour=hour,
             minute=minute,
+            timezone=config.TZINFO,
             id="monthly_report",
             replace_existing=True
         )
-        print(f"⏰ Monthly report scheduled for {monthly_time} on the 1st day of the month")
-
-    scheduler.start()
-    print("⏰ Scheduler started with configured report jobs.")
+        print(f"⏰ Monthly report scheduled for {hour:02d}:{minute:02d} on the 1st day of the month")
+    elif scheduler.get_job("monthly_report"):
+        scheduler.remove_job("monthly_report")
+        print("⏰ Monthly report disabled")
 
 def start_scheduler():
     schedule_reports()
+
+    # Move readings spooled during database outages into the readings table
+    scheduler.add_job(
+        replay_pending,
+        trigger="interval",
+        seconds=SPOOL_REPLAY_INTERVAL,
+        id="spool_replay",
+        replace_existing=True
+    )
+
+    # Delete monthly partition files past the retention period, shortly after midnight UTC
+    scheduler.add_job(
+        prune_partitions,
+        trigger="cron",
+        hour=0,
+        minute=5,
+        timezone="UTC",
+        id="partition_retention",
+        replace_existing=True
+    )
+    scheduler.start()
+    print("⏰ Scheduler started with configured report jobs.")
@@ -0,0 +1,228 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# Write-ahead spool for readings that could not be saved to the database (locked, disk
+# full, being migrated).
+#
+# Readings are appended to readings.spool as fixed-size records (topic id, epoch, value);
+# the topic names are kept in topics.txt, one per line, the line number being the id. Each
+# record is written straight to the OS, so a crash of the process loses nothing, and fsync
+# is batched (every FSYNC_RECORDS records or FSYNC_INTERVAL seconds) against power loss.
+#
+# A scheduler job replays the spool in bulk (one transaction per partition) once the
+# database accepts writes again. The active file is first renamed to a batch file with a
+# unique name, which is recorded in the same transaction as its readings, so a crash between
+# the commit and the removal of the batch file only means the next replay skips that batch.
+# Replay repeats until the spool is empty, so ingest goes back to writing the database
+# directly. A batch that cannot be decoded is renamed to *.bad and kept for inspection.
+
+import glob
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from config.config import get_config
+
+# topic id (uint32), UTC epoch seconds (int64), value (double)
+RECORD = struct.Struct('<Iqd')
+
+FSYNC_RECORDS = 256
+FSYNC_INTERVAL = 1.0
+
+class Spool:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.path = os.path.join(directory, 'readings.spool')
+        self.topics_path = os.path.join(directory, 'topics.txt')
+        self.lock = threading.Lock()
+        self.file = None
+        self.topic_ids = None
+        self.unsynced = 0
+        self.last_sync = 0.0
+        self.dropped = 0
+
+    @property
+    def pending(self):
+        """True while readings are waiting to be replayed; new readings queue up behind them."""
+        return self.file is not None or os.path.exists(self.path) or bool(self._batches())
+
+    def _batches(self):
+        """Batch files waiting to be replayed, oldest first."""
+        return sorted(glob.glob(glob.escape(self.path) + '.*.replay'))
+
+    def _load_topics(self, errors='strict'):
+        if not os.path.exists(self.topics_path):
+            return []
+        with open(self.topics_path, encoding='utf-8', errors=errors) as f:
+            return f.read().split('\n')[:-1]
+
+    def _topic_id(self, topic):
+        if self.topic_ids is None:
+            # Only the number of names matters for new ids, so a damaged name must not stop ingest
+            self.topic_ids = {name: i for i, name in enumerate(self._load_topics(errors='replace'))}
+        topic_id = self.topic_ids.get(topic)
+        if topic_id is None:
+            topic_id = len(self.topic_ids)
+            # The name must be on disk before any record that refers to it
+            with open(self.topics_path, 'ab', buffering=0) as f:
+                size = f.tell()
+                try:
+                    f.write(topic.encode('utf-8') + b'\n')
+                    os.fsync(f.fileno())
+                except OSError:
+                    # Don't leave half a name behind to merge with the next one
+                    try:
+                        f.truncate(size)
+                    except OSError:
+                        pass
+                    raise
+            self.topic_ids[topic] = topic_id
+        return topic_id
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.file = open(self.path, 'ab', buffering=0)
+        # Drop a record torn by a crash mid-write
+        size = os.fstat(self.file.fileno()).st_size
+        if size % RECORD.size:
+            self.file.truncate(size - size % RECORD.size)
+
+    def _size(self):
+        size = os.fstat(self.file.fileno()).st_size
+        for path in self._batches():
+            size += os.path.getsize(path)
+        return size
+
+    def append(self, topic, timestamp, value):
+        """Spool one reading. Returns False (and drops it) when the spool is full or cannot be written."""
+        with self.lock:
+            try:
+                if self.file is None:
+                    self._open()
+                if self._size() + RECORD.size > self.max_bytes:
+                    if not self.dropped:
+                        print(f"⚠️ Spool is full ({self.max_bytes // (1024 * 1024)} MB), dropping readings until the database recovers")
+                    self.dropped += 1
+                    return False
+
+                self.file.write(RECORD.pack(self._topic_id(topic), timestamp, value))
+                self.unsynced += 1
+                now = time.monotonic()
+                if self.unsynced >= FSYNC_RECORDS or now - self.last_sync >= FSYNC_INTERVAL:
+                    os.fsync(self.file.fileno())
+                    self.unsynced = 0
+                    self.last_sync = now
+                return True
+            except OSError as e:
+                # Disk full as well: drop the reading rather than stop the MQTT loop. Reopening
+                # the file on the next append truncates a record torn by the failed write.
+                print(f"⚠️ Could not spool reading {topic}: {e}")
+                if self.file is not None:
+                    try:
+                        self.file.close()
+                    except OSError:
+                        pass
+                    self.file = None
+                self.dropped += 1
+                return False
+
+    def _rotate(self):
+        """
+        The next batch file to replay, moving the active spool aside if there is none left
+        over from a failed replay, so ingest can keep appending meanwhile. None when empty.
+        """
+        with self.lock:
+            batches = self._batches()
+            if batches:
+                return batches[0]
+            if self.file is not None:
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+                self.unsynced = 0
+            if not os.path.exists(self.path):
+                return None
+            batch_path = f"{self.path}.{time.time_ns()}.replay"
+            os.replace(self.path, batch_path)
+            return batch_path
+
+    def _quarantine(self, batch_path, error):
+        bad_path = batch_path + '.bad'
+        os.replace(batch_path, bad_path)
+        # The topic ids only make sense with the topic names of the time
+        with self.lock:
+            if os.path.exists(self.topics_path):
+                shutil.copyfile(self.topics_path, bad_path + '.topics')
+        print(f"❌ Could not decode {os.path.basename(batch_path)} ({error}), moved it to {os.path.basename(bad_path)}")
+
+    def replay(self):
+        """Insert spooled readings until the spool is empty. Returns the number inserted."""
+        from app.db import insert_readings
+        inserted = 0
+        skipped = 0
+        while True:
+            batch_path = self._rotate()
+            if batch_path is None:
+                break
+            with open(batch_path, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % RECORD.size
+            try:
+                with self.lock:
+                    topics = self._load_topics()
+                rows = [(timestamp, topics[topic_id], value)
+                        for topic_id, timestamp, value in RECORD.iter_unpack(data[:usable])]
+            except (ValueError, IndexError) as e:
+                self._quarantine(batch_path, e)
+                continue
+
+            count = insert_readings(rows, batch=os.path.basename(batch_path))
+            inserted += count
+            skipped += len(rows) - count
+            os.remove(batch_path)
+
+        with self.lock:
+            dropped, self.dropped = self.dropped, 0
+            # Topic ids are only meaningful to spooled records; start afresh once there are none
+            if self.file is None and not os.path.exists(self.path) and not self._batches() and os.path.exists(self.topics_path):
+                os.remove(self.topics_path)
+                self.topic_ids = None
+        if inserted or skipped or dropped:
+            print(f"♻️ Replayed {inserted} spooled readings"
+                  + (f", {skipped} already saved by an interrupted replay" if skipped else "")
+                  + (f", {dropped} dropped while the spool could not be written" if dropped else ""))
+        return inserted
+
+def spool_dir(config):
+    return os.path.join(os.path.dirname(os.path.abspath(config.DATABASE_PATH)), 'spool')
+
+def build_spool(config=None):
+    config = config or get_config()
+    return Spool(spool_dir(config), config.SPOOL_MAX_MB * 1024 * 1024)
+
+spool = build_spool()
+
+def replay_pending():
+    """Scheduler job: replay the spool if there is anything in it and the database accepts writes."""
+    if not spool.pending:
+        return
+    try:
+        spool.replay()
+    except sqlite3.Error as e:
+        print(f"⚠️ Database still unavailable, keeping the spooled readings for later: {e}")
+    except (OSError, ValueError) as e:
+        # e.g. an unreadable topics.txt; the spool is kept and retried on the next run
+        print(f"❌ Could not replay the spool in {spool.directory}: {e}")
@@ -11,13 +11,68 @@ https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
 Thank you for your support!
 """
 
-import os
-
-def get_selected_metrics():
-    """Return a list of active metrics (value == 1) from the .env file."""
-    selected_metrics = []
-    for key, value in os.environ.items():
-        if key.startswith("METRIC_") and value.strip() == "1":
-            metric_name = key.replace("METRIC_", "").lower()
-            selected_metrics.append(metric_name)
-    return selected_metrics
+import json
+from datetime import datetime, time, timedelta
+from config.config import get_config
+
+def local_tz():
+    """Return the configured local timezone (TZ in the .env file)."""
+    return get_config().TZINFO
+
+def local_now(config=None):
+    """Return the current time as an aware datetime in the configured timezone."""
+    return datetime.now((config or get_config()).TZINFO)
+
+def build_day_table(start_date, days):
+    """
+    Precompute the UTC epoch of each local midnight from start_date onwards.
+    Returns days + 1 boundaries, so day i covers bounds[i] <= timestamp < bounds[i + 1].
+    DST transitions are resolved here once instead of for every reading.
+    An aware start_date keeps its own timezone, so a report uses one config snapshot throughout.
+    """
+    if isinstance(start_date, datetime):
+        tz = start_date.tzinfo or local_tz()
+        first_day = start_date.date()
+    else:
+        tz = local_tz()
+        first_day = start_date
+    return [
+        int(datetime.combine(first_day + timedelta(days=i), time(), tzinfo=tz).timestamp())
+        for i in range(days + 1)
+    ]
+
+def parse_timestamp(value, tz=None):
+    """
+    Convert a stored or imported timestamp to a UTC epoch (int seconds).
+    Accepts epochs (int, float or numeric text) and ISO 8601 strings. Naive ISO strings
+    are interpreted in the configured timezone; an ambiguous DST hour maps to its first occurrence.
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    try:
+        return int(float(text))
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz or local_tz())
+    return int(dt.timestamp())
+
+def parse_payload(payload):
+    """
+    Return the state carried by a Solar Assistant MQTT payload (bytes or str):
+    either a JSON object with a 'state' key or a bare number.
+    """
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    try:
+        # First, try to parse as JSON
+        data = json.loads(payload)
+        if isinstance(data, dict) and 'state' in data:
+            return data['state']
+        # If no 'state' key, just store raw payload
+        return float(payload)
+    except json.JSONDecodeError:
+        # If not JSON, assume raw value
+        return float(payload)
@@ -0,0 +1,73 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# Per-message cost of live alert evaluation.
+#
+#     python benchmarks/alert_rules.py [--rules 5000] [--topics 500] [--messages 200000]
+#
+# Builds an engine with thousands of rules spread over many topics and feeds it a stream of
+# readings, most of them near the thresholds so rules keep changing state. Prints the cost
+# per message next to the cost of parsing the payload, which on_message pays anyway.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.alerts import AlertEngine, AlertRule  # noqa: E402
+from config.config import TOPIC_TEMPLATE  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure alert rule evaluation cost per message.")
+    parser.add_argument("--rules", type=int, default=5000)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    topics = [TOPIC_TEMPLATE.format(f"metric_{i}") for i in range(args.topics)]
+    rules = []
+    for i in range(args.rules):
+        below = i % 2 == 0
+        threshold = random.uniform(40, 60)
+        clear = threshold + 5 if below else threshold - 5
+        rules.append(AlertRule(topics[i % args.topics], below, threshold, clear, random.choice((0, 30, 300))))
+
+    fired = []
+    engine = AlertEngine(rules, cooldown=3600, max_per_hour=10 ** 9,
+                         notify=lambda rule, timestamp, value, suppressed: fired.append(rule))
+
+    stream = [(random.choice(topics), 1_700_000_000 + i, random.uniform(30, 70)) for i in range(args.messages)]
+    payloads = [json.dumps({"state": value}).encode() for _, _, value in stream]
+
+    started = time.perf_counter()
+    for payload in payloads:
+        json.loads(payload.decode("utf-8"))
+    parse_us = (time.perf_counter() - started) / len(stream) * 1e6
+
+    started = time.perf_counter()
+    for topic, timestamp, value in stream:
+        engine.evaluate(topic, timestamp, value)
+    evaluate_us = (time.perf_counter() - started) / len(stream) * 1e6
+
+    print(f"{len(rules)} rules on {len(topics)} topics ({len(rules) / len(topics):.0f} per topic), "
+          f"{len(stream)} messages, {len(fired)} alerts fired")
+    print(f"Rule evaluation: {evaluate_us:.2f} µs per message")
+    print(f"Payload parsing: {parse_us:.2f} µs per message (for comparison)")
+
+if __name__ == "__main__":
+    main()
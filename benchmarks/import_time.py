@@ -0,0 +1,99 @@
+"""
+Email Scheduler for Solar Assistant
+
+Author: Stefan Verster
+Copyright © 2025 Stefan Verster
+
+This code is available for personal and non-commercial use.
+If you find this software useful, please consider supporting the author by making a donation:
+https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
+
+Thank you for your support!
+"""
+
+# Startup cost of the one-shot report entry point.
+#
+#     python benchmarks/import_time.py [--module app.report] [--budget-ms 200] [--runs 5]
+#
+# Reports the cumulative import time of the module (from `python -X importtime`), the
+# slowest imports by self time, and the wall-clock time of a fresh interpreter that imports
+# the module and runs its first database query. Exits non-zero when the best time to first
+# query exceeds the budget, so it can be used to catch startup regressions.
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_QUERY = (
+    "import {module}\n"
+    "from app.db import connect\n"
+    "connect().execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchall()\n"
+)
+
+def parse_importtime(stderr):
+    """Return (module, self_us, cumulative_us) tuples from `-X importtime` output."""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # header line
+        entries.append((fields[2].strip(), self_us, cumulative_us))
+    return entries
+
+def measure_imports(module):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    return parse_importtime(result.stderr)
+
+def measure_first_query(module, runs):
+    timings = []
+    # A throwaway database, so the check runs on a fresh checkout without a data/ directory
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, DATABASE_PATH=os.path.join(directory, "benchmark.db"))
+        for _ in range(runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", FIRST_QUERY.format(module=module)],
+                           cwd=ROOT, env=env, check=True)
+            timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure report entry point startup cost.")
+    parser.add_argument("--module", default="app.report")
+    parser.add_argument("--budget-ms", type=float, default=200.0)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    entries = measure_imports(args.module)
+    total_us = next((cumulative for name, _, cumulative in entries if name == args.module), 0)
+    print(f"Import of {args.module}: {total_us / 1000:.1f} ms cumulative")
+    print(f"Slowest {args.top} imports by self time:")
+    for name, self_us, cumulative_us in sorted(entries, key=lambda e: e[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {name}")
+
+    heavy = [name for name, _, _ in entries if name in ("smtplib", "email.mime.multipart", "apscheduler", "paho.mqtt.client")]
+    if heavy:
+        print(f"⚠️ Heavy modules imported eagerly: {', '.join(heavy)}")
+
+    timings = measure_first_query(args.module, args.runs)
+    best = min(timings)
+    print(f"Time to first query (interpreter start included): best {best:.1f} ms, "
+          f"worst {max(timings):.1f} ms over {len(timings)} runs")
+
+    if best > args.budget_ms:
+        print(f"❌ Over budget of {args.budget_ms:.0f} ms")
+        sys.exit(1)
+    print(f"✅ Within budget of {args.budget_ms:.0f} ms")
+
+if __name__ == "__main__":
+    main()
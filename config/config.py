@@ -12,32 +12,310 @@ Thank you for your support!
 """
 
 import os
-from dotenv import load_dotenv
+import threading
+from dataclasses import dataclass
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
-load_dotenv()
+# The project's .env file. python-dotenv is only imported when the file exists,
+# which keeps one-shot runs (env already provided by Docker or cron) fast to start.
+ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
 
+# Full MQTT topic of a Solar Assistant total metric, e.g. solar_assistant/total/pv_power/state
+TOPIC_TEMPLATE = "solar_assistant/total/{}/state"
+
+# ALERT_* settings that are not per-metric alert rules
+ALERT_SETTINGS = ("ALERT_COOLDOWN", "ALERT_MAX_PER_HOUR")
+
+# The process environment (Docker, cron) before the .env file was loaded
+PROCESS_ENV = dict(os.environ)
+
+class ConfigError(ValueError):
+    """Raised when the .env settings are invalid. Lists every problem found."""
+
+@dataclass(frozen=True)
 class Config:
-    MQTT_BROKER = os.getenv('MQTT_BROKER')
-    MQTT_PORT = int(os.getenv('MQTT_PORT', 1883))
-    MQTT_USERNAME = os.getenv('MQTT_USERNAME')
-    MQTT_PASSWORD = os.getenv('MQTT_PASSWORD')
-    EMAIL_SMTP = os.getenv('EMAIL_SMTP')
-    EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
-    EMAIL_USERNAME = os.getenv('EMAIL_USERNAME')
-    EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD')
-    EMAIL_TO = os.getenv('EMAIL_TO')
-    DATABASE_PATH = os.getenv('DATABASE_PATH', 'data/solar_assistant.db')
-    
-    # Report scheduling settings
-    REPORT_DAILY = os.getenv('REPORT_DAILY', "0")
-    REPORT_DAILY_TIME = os.getenv('REPORT_DAILY_TIME', "11:40")
-    REPORT_WEEKLY = os.getenv('REPORT_WEEKLY', "0")
-    REPORT_WEEKLY_TIME = os.getenv('REPORT_WEEKLY_TIME', "12:00")
-    REPORT_MONTHLY = os.getenv('REPORT_MONTHLY', "0")
-    REPORT_MONTHLY_TIME = os.getenv('REPORT_MONTHLY_TIME', "12:30")
-    
-    # CSV Attachment Option: set to "1" to include a CSV report, "0" otherwise.
-    CSV_REPORT = os.getenv('CSV_REPORT', "0")
-    
-    # Timezone setting: used for container time display
-    TZ = os.getenv('TZ', 'UTC')
+    """
+    An immutable, validated snapshot of the settings.
+    Use get_config() to obtain the current snapshot; a SIGHUP swaps in a new one.
+    """
+    MQTT_BROKER: str
+    MQTT_PORT: int
+    MQTT_USERNAME: str
+    MQTT_PASSWORD: str
+
+    # MQTT session: QoS for the subscriptions, protocol (v311 or v5), and persistent sessions
+    # (MQTT_CLEAN_SESSION=0 with a fixed MQTT_CLIENT_ID keeps messages queued while disconnected)
+    MQTT_QOS: int
+    MQTT_PROTOCOL: str
+    MQTT_CLEAN_SESSION: bool
+    MQTT_CLIENT_ID: str
+
+    # Subscriptions: "reports" (only the topics reports and alerts use) or "all" (solar_assistant/total/#),
+    # extra topic filters such as per-inverter topics, and an optional shared subscription group
+    MQTT_SUBSCRIBE: str
+    MQTT_INVERTER_TOPICS: tuple
+    MQTT_SHARED_GROUP: str
+    EMAIL_SMTP: str
+    EMAIL_PORT: int
+    EMAIL_USERNAME: str
+    EMAIL_PASSWORD: str
+    EMAIL_TO: str
+    EMAIL_RECIPIENTS: tuple
+
+    # Recipient groups from EMAIL_TO, separated by ';'. Each group gets its own envelope and To header
+    EMAIL_GROUPS: tuple
+
+    # Attachment compression: none, gzip (each file) or zip (one archive)
+    ATTACHMENT_COMPRESSION: str
+    DATABASE_PATH: str
+
+    # single: one readings table; monthly: one SQLite file per month, pruned after RETENTION_MONTHS (0 = never)
+    STORAGE_MODE: str
+    RETENTION_MONTHS: int
+
+    # Report scheduling settings, times parsed to (hour, minute)
+    REPORT_DAILY: bool
+    REPORT_DAILY_TIME: tuple
+    REPORT_WEEKLY: bool
+    REPORT_WEEKLY_TIME: tuple
+    REPORT_MONTHLY: bool
+    REPORT_MONTHLY_TIME: tuple
+
+    # CSV Attachment Option
+    CSV_REPORT: bool
+
+    # Inline chart images in the report emails
+    CHART_REPORT: bool
+
+    # Profile every report run (stage timings and query plans, written to data/profiles/)
+    REPORT_PROFILE: bool
+
+    # Timezone setting: used for container time display and report day boundaries
+    TZ: str
+    TZINFO: ZoneInfo
+
+    # Readings kept in memory per topic for "today so far" queries (48 hours at 5-second intervals)
+    LIVE_BUFFER_SIZE: int
+
+    # Disk space for readings spooled while the database is unavailable
+    SPOOL_MAX_MB: int
+
+    # Metrics enabled with METRIC_<name>=1, as short names and as full topic names
+    SELECTED_METRICS: frozenset
+    SELECTED_TOPICS: frozenset
+
+    # Live alerts from ALERT_<name>=<rule>[;<rule>...], as (topic, below, threshold, clear, seconds) tuples
+    ALERT_RULES: tuple
+    ALERT_COOLDOWN: int
+    ALERT_MAX_PER_HOUR: int
+
+    @classmethod
+    def from_env(cls, env):
+        errors = []
+
+        def flag(name, default):
+            value = env.get(name, default).strip()
+            if value not in ("0", "1"):
+                errors.append(f"{name} must be 0 or 1, got {value!r}")
+            return value == "1"
+
+        def port(name, default):
+            value = env.get(name, default).strip()
+            try:
+                number = int(value)
+            except ValueError:
+                number = 0
+            if not 0 < number < 65536:
+                errors.append(f"{name} must be a port number, got {value!r}")
+            return number
+
+        def positive_int(name, default):
+            value = env.get(name, default).strip()
+            try:
+                number = int(value)
+            except ValueError:
+                number = 0
+            if number <= 0:
+                errors.append(f"{name} must be a positive integer, got {value!r}")
+            return number
+
+        def non_negative_int(name, default):
+            value = env.get(name, default).strip()
+            try:
+                number = int(value)
+            except ValueError:
+                number = -1
+            if number < 0:
+                errors.append(f"{name} must be 0 or a positive integer, got {value!r}")
+            return number
+
+        def choice(name, default, options):
+            value = env.get(name, default).strip().lower()
+            if value not in options:
+                errors.append(f"{name} must be one of {', '.join(options)}, got {value!r}")
+            return value
+
+        def clock_time(name, default):
+            value = env.get(name, default).strip()
+            try:
+                hour, minute = map(int, value.split(":"))
+                if 0 <= hour < 24 and 0 <= minute < 60:
+                    return (hour, minute)
+            except ValueError:
+                pass
+            errors.append(f"{name} must be a time in HH:MM format, got {value!r}")
+            return (0, 0)
+
+        tz_name = env.get('TZ', 'UTC').strip()
+        try:
+            tzinfo = ZoneInfo(tz_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            errors.append(f"TZ must be an IANA time zone identifier, got {tz_name!r}")
+            tzinfo = ZoneInfo('UTC')
+
+        def alert_rules():
+            # e.g. ALERT_battery_state_of_charge=<20,clear=25,for=300 (below 20% for 5 minutes)
+            rules = []
+            for key, value in sorted(env.items()):
+                if not key.startswith("ALERT_") or key in ALERT_SETTINGS:
+                    continue
+                topic = TOPIC_TEMPLATE.format(key[len("ALERT_"):].lower())
+                for rule in filter(None, (part.strip() for part in value.split(";"))):
+                    try:
+                        condition, *options = [field.strip() for field in rule.split(",")]
+                        below = condition[0] == "<"
+                        if condition[0] not in "<>":
+                            raise ValueError
+                        threshold = float(condition[1:])
+                        extra = dict(option.split("=", 1) for option in options)
+                        clear = float(extra.pop("clear", threshold))
+                        seconds = int(extra.pop("for", 0))
+                        if extra or seconds < 0 or (clear < threshold if below else clear > threshold):
+                            raise ValueError
+                    except (ValueError, IndexError):
+                        errors.append(f"{key} has an invalid rule {rule!r}, expected e.g. <20,clear=25,for=300")
+                        continue
+                    rules.append((topic, below, threshold, clear, seconds))
+            return tuple(rules)
+
+        qos = choice('MQTT_QOS', "0", ("0", "1", "2"))
+        clean_session = flag('MQTT_CLEAN_SESSION', "1")
+        client_id = env.get('MQTT_CLIENT_ID', "").strip()
+        if not clean_session and not client_id:
+            errors.append("MQTT_CLEAN_SESSION=0 needs a fixed MQTT_CLIENT_ID to resume the session")
+        shared_group = env.get('MQTT_SHARED_GROUP', "").strip()
+        if any(char in shared_group for char in "/+#"):
+            errors.append(f"MQTT_SHARED_GROUP must not contain '/', '+' or '#', got {shared_group!r}")
+
+        email_to = env.get('EMAIL_TO') or ""
+        email_groups = tuple(
+            group for group in (
+                tuple(email.strip() for email in part.split(',') if email.strip())
+                for part in email_to.split(';')
+            ) if group
+        )
+        selected_metrics = frozenset(
+            key[len("METRIC_"):].lower()
+            for key, value in env.items()
+            if key.startswith("METRIC_") and value.strip() == "1"
+        )
+
+        config = cls(
+            MQTT_BROKER=env.get('MQTT_BROKER'),
+            MQTT_PORT=port('MQTT_PORT', "1883"),
+            MQTT_USERNAME=env.get('MQTT_USERNAME'),
+            MQTT_PASSWORD=env.get('MQTT_PASSWORD'),
+            MQTT_QOS=int(qos) if qos.isdigit() else 0,
+            MQTT_PROTOCOL=choice('MQTT_PROTOCOL', "v311", ("v311", "v5")),
+            MQTT_CLEAN_SESSION=clean_session,
+            MQTT_CLIENT_ID=client_id,
+            MQTT_SUBSCRIBE=choice('MQTT_SUBSCRIBE', "reports", ("reports", "all")),
+            MQTT_INVERTER_TOPICS=tuple(topic.strip() for topic in env.get('MQTT_INVERTER_TOPICS', "").split(',') if topic.strip()),
+            MQTT_SHARED_GROUP=shared_group,
+            EMAIL_SMTP=env.get('EMAIL_SMTP'),
+            EMAIL_PORT=port('EMAIL_PORT', "587"),
+            EMAIL_USERNAME=env.get('EMAIL_USERNAME'),
+            EMAIL_PASSWORD=env.get('EMAIL_PASSWORD'),
+            EMAIL_TO=email_to,
+            EMAIL_RECIPIENTS=tuple(dict.fromkeys(email for group in email_groups for email in group)),
+            EMAIL_GROUPS=email_groups,
+            ATTACHMENT_COMPRESSION=choice('ATTACHMENT_COMPRESSION', "none", ("none", "gzip", "zip")),
+            DATABASE_PATH=env.get('DATABASE_PATH', 'data/solar_assistant.db'),
+            STORAGE_MODE=choice('STORAGE_MODE', "single", ("single", "monthly")),
+            RETENTION_MONTHS=non_negative_int('RETENTION_MONTHS', "0"),
+            REPORT_DAILY=flag('REPORT_DAILY', "0"),
+            REPORT_DAILY_TIME=clock_time('REPORT_DAILY_TIME', "11:40"),
+            REPORT_WEEKLY=flag('REPORT_WEEKLY', "0"),
+            REPORT_WEEKLY_TIME=clock_time('REPORT_WEEKLY_TIME', "12:00"),
+            REPORT_MONTHLY=flag('REPORT_MONTHLY', "0"),
+            REPORT_MONTHLY_TIME=clock_time('REPORT_MONTHLY_TIME', "12:30"),
+            CSV_REPORT=flag('CSV_REPORT', "0"),
+            CHART_REPORT=flag('CHART_REPORT', "0"),
+            REPORT_PROFILE=flag('REPORT_PROFILE', "0"),
+            TZ=tz_name,
+            TZINFO=tzinfo,
+            LIVE_BUFFER_SIZE=positive_int('LIVE_BUFFER_SIZE', "34560"),
+            SPOOL_MAX_MB=positive_int('SPOOL_MAX_MB', "64"),
+            SELECTED_METRICS=selected_metrics,
+            SELECTED_TOPICS=frozenset(TOPIC_TEMPLATE.format(name) for name in selected_metrics),
+            ALERT_RULES=alert_rules(),
+            ALERT_COOLDOWN=positive_int('ALERT_COOLDOWN', "3600"),
+            ALERT_MAX_PER_HOUR=positive_int('ALERT_MAX_PER_HOUR', "6"),
+        )
+
+        if errors:
+            raise ConfigError("Invalid configuration: " + "; ".join(errors))
+        return config
+
+_config = None
+_config_lock = threading.Lock()
+# Keys that os.environ holds because of the .env file
+_file_keys = set()
+
+def read_env_file():
+    """The settings in the .env file, or {} when there is none."""
+    if not os.path.exists(ENV_FILE):
+        return {}
+    from dotenv import dotenv_values
+    return {key: value for key, value in dotenv_values(ENV_FILE).items() if value is not None}
+
+def build_env(file_wins=False):
+    """
+    The process environment combined with the .env file. At startup the process environment
+    wins, so a one-off DATABASE_PATH=... still applies; on reload the edited file wins.
+    """
+    file_env = read_env_file()
+    return {**PROCESS_ENV, **file_env} if file_wins else {**file_env, **PROCESS_ENV}
+
+def apply_env(env):
+    """Make os.environ match env, dropping keys that were only set by a previous .env file."""
+    global _file_keys
+    for key in _file_keys - env.keys():
+        os.environ.pop(key, None)
+    os.environ.update(env)
+    _file_keys = set(env) - set(PROCESS_ENV)
+
+def get_config():
+    """Return the current settings snapshot, loading the .env file on first use."""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                env = build_env()
+                _config = Config.from_env(env)
+                apply_env(env)
+    return _config
+
+def reload_config():
+    """
+    Re-read the .env file and swap in a new snapshot; settings removed from the file return
+    to their defaults. Raises ConfigError and keeps the current snapshot and environment if
+    the new settings are invalid.
+    """
+    global _config
+    with _config_lock:
+        env = build_env(file_wins=True)
+        config = Config.from_env(env)
+        apply_env(env)
+        _config = config
+    return _config
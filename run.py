@@ -11,21 +11,53 @@ https://www.paypal.com/donate/?hosted_button_id=2YZ4F42REQX4C
 Thank you for your support!
 """
 
-from app.mqtt_client import start_mqtt
-from app.scheduler import start_scheduler
-from app.db import init_db  # 🛠️ ADD this import!
+from app.mqtt_client import start_mqtt, reload_subscriptions
+from app.scheduler import start_scheduler, schedule_reports
+from app.db import init_db, prune_partitions  # 🛠️ ADD this import!
+from app.live_store import warm_from_db
+from app.alerts import reload_rules
+from app.spool import replay_pending
+from config.config import get_config, reload_config, ConfigError
+import signal
 import time
 
+def handle_sighup(signum, frame):
+    """Reload the .env settings, reschedule the reports and update the MQTT subscriptions; the connection is left running."""
+    try:
+        config = reload_config()
+    except ConfigError as e:
+        print(f"❌ Config reload failed, keeping the current settings: {e}")
+        return
+    print("🔄 Configuration reloaded.")
+    schedule_reports(config)
+    reload_rules(config)
+    reload_subscriptions(config)
+
 def main():
+    # Validate the settings up front so a bad .env fails at startup, not at report time
+    get_config()
+
     # 🛠️ Initialize the database first
     init_db()
 
+    # Drop month files that are past the retention period (STORAGE_MODE=monthly)
+    prune_partitions()
+
+    # Save readings spooled before a crash or restart, so today's data below is complete
+    replay_pending()
+
+    # Load today's readings into memory before new ones start arriving
+    warm_from_db()
+
     # Start the MQTT listener
     start_mqtt()
 
     # Start the Scheduler
     start_scheduler()
 
+    # Reload the configuration on SIGHUP (e.g. docker kill -s HUP solarassistant-reports)
+    signal.signal(signal.SIGHUP, handle_sighup)
+
     # Keep the app running forever
     while True:
         time.sleep(1)